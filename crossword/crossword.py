@@ -1,3 +1,12 @@
+import bisect
+import json
+import mmap
+import os
+import struct
+import sys
+from array import array
+
+
 class Variable():
 
     ACROSS = "across"
@@ -35,9 +44,292 @@ class Variable():
         return f"Variable({self.i}, {self.j}, {direction}, {self.length})"
 
 
+class WordBucket():
+    """Read-only sequence of equal-length words stored as fixed-width records."""
+
+    def __init__(self, buffer, offset, count, width):
+        self.buffer = buffer
+        self.offset = offset
+        self.count = count
+        self.width = width
+
+    def __len__(self):
+        return self.count
+
+    def __getitem__(self, k):
+        if not 0 <= k < self.count:
+            raise IndexError(k)
+        start = self.offset + k * self.width
+        record = bytes(self.buffer[start:start + self.width])
+        return record.rstrip(b"\0").decode("utf-8")
+
+    def __iter__(self):
+        for k in range(self.count):
+            yield self[k]
+
+
+class WordIndex():
+    """
+    Vocabulary bucketed by word length and, within each bucket,
+    by (position, letter).
+
+    The index can be written to a binary file and loaded back by mmap,
+    so large dictionaries are only parsed once and words are decoded
+    on demand instead of being held in memory as Python strings.
+    """
+
+    MAGIC = b"XWIDX1\n"
+
+    def __init__(self, buckets, postings):
+        """
+        Create an index from `buckets`, a dict from length to a sequence
+        of words, and `postings`, a dict from (length, position, letter)
+        to a sequence of word ids into the bucket of that length.
+        """
+        self.buckets = buckets
+        self.postings = postings
+
+        # Letters found at each (length, position), and the bitsets of
+        # postings built so far by `mask`
+        self.alphabet = dict()
+        for (length, position, letter) in sorted(postings):
+            self.alphabet.setdefault((length, position), []).append(letter)
+        self.masks = dict()
+
+    @classmethod
+    def from_words(cls, words):
+        """Build an index in memory from an iterable of words."""
+        buckets = dict()
+        for word in sorted(set(words)):
+            buckets.setdefault(len(word), []).append(word)
+
+        postings = dict()
+        for length, bucket in buckets.items():
+            for k, word in enumerate(bucket):
+                for position, letter in enumerate(word):
+                    key = (length, position, letter)
+                    postings.setdefault(key, array("I")).append(k)
+        return cls(buckets, postings)
+
+    @classmethod
+    def from_file(cls, words_file, index_file=None):
+        """
+        Load the index for `words_file`, one word per line.
+        The index is read by mmap from `index_file` (by default
+        `words_file` + ".idx") when that is newer than `words_file`;
+        otherwise it is rebuilt from the words and saved there.
+        """
+        if index_file is None:
+            index_file = words_file + ".idx"
+        try:
+            if os.path.getmtime(index_file) >= os.path.getmtime(words_file):
+                return cls.load(index_file)
+        except (OSError, ValueError):
+            pass
+
+        with open(words_file) as f:
+            index = cls.from_words(f.read().upper().splitlines())
+        try:
+            index.save(index_file)
+        except OSError:
+            pass
+        return index
+
+    def save(self, filename):
+        """
+        Write the index to `filename` in the binary mmap format. The file
+        is written beside it and renamed into place, so a reader never sees
+        a partial index.
+        """
+        header = {"byteorder": sys.byteorder, "buckets": [], "postings": []}
+        chunks = []
+        offset = 0
+
+        def add(data):
+            nonlocal offset
+            start = offset
+            padding = -len(data) % 4
+            chunks.append(data + b"\0" * padding)
+            offset += len(data) + padding
+            return start
+
+        for length, bucket in sorted(self.buckets.items()):
+            encoded = [word.encode("utf-8") for word in bucket]
+            width = max(len(word) for word in encoded)
+            data = b"".join(word.ljust(width, b"\0") for word in encoded)
+            header["buckets"].append([length, add(data), len(encoded), width])
+
+        for (length, position, letter), ids in sorted(self.postings.items()):
+            start = add(array("I", ids).tobytes())
+            header["postings"].append([length, position, letter, start, len(ids)])
+
+        encoded = json.dumps(header).encode("utf-8")
+        temporary = filename + ".tmp"
+        with open(temporary, "wb") as f:
+            f.write(WordIndex.MAGIC)
+            f.write(struct.pack("<I", len(encoded)))
+            f.write(encoded)
+            f.write(b"\0" * (-f.tell() % 4))
+            for chunk in chunks:
+                f.write(chunk)
+        os.replace(temporary, filename)
+
+    @classmethod
+    def load(cls, filename):
+        """
+        Load an index written by `save`, mapping the file into memory.
+        Raise ValueError if the file is not a complete word index.
+        """
+        with open(filename, "rb") as f:
+            buffer = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        if buffer[:len(cls.MAGIC)] != cls.MAGIC:
+            raise ValueError(f"{filename} is not a word index")
+        start = len(cls.MAGIC)
+        try:
+            (size,) = struct.unpack("<I", buffer[start:start + 4])
+            header = json.loads(buffer[start + 4:start + 4 + size].decode("utf-8"))
+        except (struct.error, UnicodeDecodeError, json.JSONDecodeError):
+            raise ValueError(f"{filename} has a damaged header")
+        if header["byteorder"] != sys.byteorder:
+            raise ValueError(f"{filename} was written on another platform")
+        base = start + 4 + size
+        base += -base % 4
+
+        # every bucket and posting list must lie inside the file
+        ranges = [
+            (offset, count * width)
+            for (length, offset, count, width) in header["buckets"]
+        ] + [
+            (offset, 4 * count)
+            for (length, position, letter, offset, count) in header["postings"]
+        ]
+        if any(base + offset + size > len(buffer) for offset, size in ranges):
+            raise ValueError(f"{filename} is truncated")
+
+        view = memoryview(buffer)
+        buckets = {
+            length: WordBucket(view, base + offset, count, width)
+            for (length, offset, count, width) in header["buckets"]
+        }
+        postings = {
+            (length, position, letter):
+                view[base + offset:base + offset + 4 * count].cast("I")
+            for (length, position, letter, offset, count) in header["postings"]
+        }
+        return cls(buckets, postings)
+
+    def words(self, length):
+        """Return the sequence of words with the given length."""
+        return self.buckets.get(length, ())
+
+    def word_id(self, word):
+        """
+        Return the id of `word` in the bucket of its length,
+        or None if it is not in the vocabulary.
+        """
+        bucket = self.words(len(word))
+        k = bisect.bisect_left(bucket, word)
+        if k < len(bucket) and bucket[k] == word:
+            return k
+        return None
+
+    def letters(self, length, position):
+        """
+        Return the list of letters found at `position` in words of the
+        given length.
+        """
+        return self.alphabet.get((length, position), [])
+
+    def mask(self, length, position, letter):
+        """
+        Return the bitset, as an int with bit k set for word id k, of the
+        words of the given length that have `letter` at `position`.
+        It is built from the postings on first use and then cached.
+        """
+        key = (length, position, letter)
+        if key not in self.masks:
+            bits = bytearray((len(self.words(length)) + 7) // 8)
+            for k in self.postings.get(key, ()):
+                bits[k >> 3] |= 1 << (k & 7)
+            self.masks[key] = int.from_bytes(bits, "little")
+        return self.masks[key]
+
+    def __iter__(self):
+        for bucket in self.buckets.values():
+            yield from bucket
+
+
+class WordSet():
+    """
+    Mutable set of the words of one length in a `WordIndex`, stored as a
+    bitset of word ids. Restricting it by the index's letter masks and
+    counting its words are single integer operations, and words are only
+    decoded when iterated.
+    """
+
+    def __init__(self, index, length, mask=None):
+        """
+        Create the set of words of `length` in `index` whose ids are set
+        in `mask`, by default all of them.
+        """
+        self.index = index
+        self.length = length
+        if mask is None:
+            mask = (1 << len(index.words(length))) - 1
+        self.mask = mask
+
+    def __len__(self):
+        return self.mask.bit_count()
+
+    def __bool__(self):
+        return self.mask != 0
+
+    def ids(self):
+        """Yield the ids of the words in the set in increasing order."""
+        data = self.mask.to_bytes((self.mask.bit_length() + 7) // 8, "little")
+        for k, byte in enumerate(data):
+            while byte:
+                low = byte & -byte
+                yield 8 * k + low.bit_length() - 1
+                byte ^= low
+
+    def __iter__(self):
+        bucket = self.index.words(self.length)
+        for k in self.ids():
+            yield bucket[k]
+
+    def bit(self, word):
+        """
+        Return the bitset holding only `word`, or 0 if `word` is not
+        a word of this set's length in the index.
+        """
+        if len(word) != self.length:
+            return 0
+        k = self.index.word_id(word)
+        return 0 if k is None else 1 << k
+
+    def __contains__(self, word):
+        return bool(self.mask & self.bit(word))
+
+    def add(self, word):
+        bit = self.bit(word)
+        if not bit:
+            raise ValueError(f"{word!r} is not a word of length {self.length}")
+        self.mask |= bit
+
+    def remove(self, word):
+        if word not in self:
+            raise KeyError(word)
+        self.mask &= ~self.bit(word)
+
+
 class Crossword():
 
-    def __init__(self, structure_file, words_file):
+    def __init__(self, structure_file, words_file, index=None):
+        """
+        Load the crossword structure and vocabulary. If `index` is given,
+        that already loaded `WordIndex` is used instead of `words_file`.
+        """
 
         # Determine structure of crossword
         with open(structure_file) as f:
@@ -57,9 +349,10 @@ class Crossword():
                         row.append(False)
                 self.structure.append(row)
 
-        # Save vocabulary list
-        with open(words_file) as f:
-            self.words = set(f.read().upper().splitlines())
+        # Save vocabulary index, bucketed by word length
+        if index is None:
+            index = WordIndex.from_file(words_file)
+        self.index = index
 
         # Determine variable set
         self.variables = set()
@@ -108,26 +401,33 @@ class Crossword():
         # For any pair of variables v1, v2, their overlap is either:
         #    None, if the two variables do not overlap; or
         #    (i, j), where v1's ith character overlaps v2's jth character
+        # Only variables sharing a cell can overlap, so find those pairs
+        # through a map from each cell to the variables covering it.
         self.overlaps = dict()
         for v1 in self.variables:
             for v2 in self.variables:
-                if v1 == v2:
-                    continue
-                cells1 = v1.cells
-                cells2 = v2.cells
-                intersection = set(cells1).intersection(cells2)
-                if not intersection:
+                if v1 != v2:
                     self.overlaps[v1, v2] = None
-                else:
-                    intersection = intersection.pop()
-                    self.overlaps[v1, v2] = (
-                        cells1.index(intersection),
-                        cells2.index(intersection)
-                    )
+
+        covering = dict()
+        for var in self.variables:
+            for k, cell in enumerate(var.cells):
+                covering.setdefault(cell, []).append((var, k))
+        for cell, entries in covering.items():
+            for v1, k1 in entries:
+                for v2, k2 in entries:
+                    if v1 != v2:
+                        self.overlaps[v1, v2] = (k1, k2)
+
+        # Cache the set of overlapping variables for each variable
+        self.neighbor_sets = {
+            var: frozenset(
+                v for v in self.variables
+                if v != var and self.overlaps[v, var]
+            )
+            for var in self.variables
+        }
 
     def neighbors(self, var):
         """Given a variable, return set of overlapping variables."""
-        return set(
-            v for v in self.variables
-            if v != var and self.overlaps[v, var]
-        )
+        return set(self.neighbor_sets[var])
@@ -1,20 +1,135 @@
+import argparse
+import fnmatch
+import itertools
+import multiprocessing
+import os
+import random
 import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
 
 from crossword import *
 
 
+# Solver configurations raced by `solve_portfolio`, which differ in
+# propagation, tie-breaking seed and restart policy.
+PORTFOLIO = [
+    dict(inference="mac"),
+    dict(inference="mac", seed=1),
+    dict(inference="mac", seed=2, restart_limit=100),
+    dict(inference="forward", seed=3, restart_limit=100),
+]
+
+
+class Restart(Exception):
+    """Raised inside backtracking search when its failure limit is hit."""
+
+
+class CrosswordRenderer():
+    """
+    Renders letter grids to images. The font is loaded once and each letter
+    is rasterized once into a cell tile, so a grid is composed by pasting
+    tiles instead of measuring and drawing text cell by cell.
+    """
+
+    def __init__(self, font_file="assets/fonts/OpenSans-Regular.ttf",
+                 font_size=80, cell_size=100, cell_border=2):
+        from PIL import ImageFont
+        self.font = ImageFont.truetype(font_file, font_size)
+        self.cell_size = cell_size
+        self.cell_border = cell_border
+        self.tiles = dict()
+
+    def tile(self, letter):
+        """
+        Return the white cell tile showing `letter`, or a blank one if
+        `letter` is None.
+        """
+        if letter not in self.tiles:
+            from PIL import Image, ImageDraw
+            interior_size = self.cell_size - 2 * self.cell_border
+            tile = Image.new("RGBA", (interior_size + 1, interior_size + 1), "white")
+            if letter:
+                draw = ImageDraw.Draw(tile)
+                _, _, w, h = self.font.getbbox(letter)
+                draw.text(
+                    ((interior_size - w) / 2, (interior_size - h) / 2 - 10),
+                    letter, fill="black", font=self.font
+                )
+            self.tiles[letter] = tile
+        return self.tiles[letter]
+
+    def render(self, crossword, letters):
+        """
+        Return an image of `crossword` filled in with the 2D array `letters`.
+        """
+        from PIL import Image
+        cell_size = self.cell_size
+
+        # Create a blank canvas
+        img = Image.new(
+            "RGBA",
+            (crossword.width * cell_size, crossword.height * cell_size),
+            "black"
+        )
+
+        for i in range(crossword.height):
+            for j in range(crossword.width):
+                if crossword.structure[i][j]:
+                    img.paste(
+                        self.tile(letters[i][j]),
+                        (j * cell_size + self.cell_border,
+                         i * cell_size + self.cell_border)
+                    )
+        return img
+
+
 class CrosswordCreator():
 
-    def __init__(self, crossword):
+    # Image renderer and background writer pool, shared by all creators
+    renderer = None
+    writer = None
+
+    def __init__(self, crossword, inference="mac", lcv_limit=None,
+                 seed=None, restart_limit=None):
         """
         Create new CSP crossword generate.
+
+        `inference` selects the propagation run after each assignment
+        during backtracking: "mac" (maintain arc consistency), "forward"
+        (forward checking) or None (consistency checks only).
+
+        `lcv_limit`, if given, caps how many values of a domain are scored
+        by `order_domain_values`; larger domains are sampled.
+
+        `seed`, if given, breaks ties in variable and value ordering at
+        random. `restart_limit`, if given, restarts the search after that
+        many failed branches, doubling the limit on each restart; it must be
+        at least 1.
         """
+        if restart_limit is not None and restart_limit < 1:
+            raise ValueError(f"restart_limit must be at least 1, not {restart_limit}")
         self.crossword = crossword
+        self.inference = inference
+        self.lcv_limit = lcv_limit
+        self.seed = seed
+        self.random = random.Random(seed)
+        self.restart_limit = restart_limit
+        self.failures = 0
+        self.failure_limit = None
+        # Each domain starts as the bitset of all words with the variable's
+        # length (see `WordSet`), rather than a copy of the whole vocabulary.
         self.domains = {
-            var: self.crossword.words.copy()
+            var: WordSet(self.crossword.index, var.length)
             for var in self.crossword.variables
         }
 
+        # Trail of (var, previous bitset) domain changes, undone on backtrack
+        self.trail = []
+
+        # Words used by the current backtracking assignment
+        self.used = set()
+
     def letter_grid(self, assignment):
         """
         Return 2D array representing a given assignment.
@@ -35,54 +150,41 @@ class CrosswordCreator():
         """
         Print crossword assignment to the terminal.
         """
+        print(self.grid_text(assignment))
+
+    def grid_text(self, assignment):
+        """
+        Return crossword assignment as text, one line per row.
+        """
         letters = self.letter_grid(assignment)
+        rows = []
         for i in range(self.crossword.height):
+            row = ""
             for j in range(self.crossword.width):
                 if self.crossword.structure[i][j]:
-                    print(letters[i][j] or " ", end="")
+                    row += letters[i][j] or " "
                 else:
-                    print("█", end="")
-            print()
+                    row += "█"
+            rows.append(row)
+        return "\n".join(rows)
 
-    def save(self, assignment, filename):
+    def save(self, assignment, filename, background=False):
         """
         Save crossword assignment to an image file.
-        """
-        from PIL import Image, ImageDraw, ImageFont
-        cell_size = 100
-        cell_border = 2
-        interior_size = cell_size - 2 * cell_border
-        letters = self.letter_grid(assignment)
 
-        # Create a blank canvas
-        img = Image.new(
-            "RGBA",
-            (self.crossword.width * cell_size,
-             self.crossword.height * cell_size),
-            "black"
+        If `background` is True, the image is rendered and written by a
+        shared thread pool and a Future for the write is returned.
+        """
+        if background:
+            if CrosswordCreator.writer is None:
+                CrosswordCreator.writer = ThreadPoolExecutor()
+            return CrosswordCreator.writer.submit(self.save, assignment, filename)
+
+        if CrosswordCreator.renderer is None:
+            CrosswordCreator.renderer = CrosswordRenderer()
+        img = CrosswordCreator.renderer.render(
+            self.crossword, self.letter_grid(assignment)
         )
-        font = ImageFont.truetype("assets/fonts/OpenSans-Regular.ttf", 80)
-        draw = ImageDraw.Draw(img)
-
-        for i in range(self.crossword.height):
-            for j in range(self.crossword.width):
-
-                rect = [
-                    (j * cell_size + cell_border,
-                     i * cell_size + cell_border),
-                    ((j + 1) * cell_size - cell_border,
-                     (i + 1) * cell_size - cell_border)
-                ]
-                if self.crossword.structure[i][j]:
-                    draw.rectangle(rect, fill="white")
-                    if letters[i][j]:
-                        w, h = draw.textsize(letters[i][j], font=font)
-                        draw.text(
-                            (rect[0][0] + ((interior_size - w) / 2),
-                             rect[0][1] + ((interior_size - h) / 2) - 10),
-                            letters[i][j], fill="black", font=font
-                        )
-
         img.save(filename)
 
     def solve(self):
@@ -91,7 +193,34 @@ class CrosswordCreator():
         """
         self.enforce_node_consistency()
         self.ac3()
-        return self.backtrack(dict())
+
+        # removals made before the search never need to be undone
+        self.trail = []
+        self.used = set()
+        self.failures = 0
+        self.failure_limit = self.restart_limit
+        while True:
+            try:
+                return self.backtrack(dict())
+            except Restart:
+                # restore the domains and search again with a larger limit
+                self.undo(0)
+                self.used = set()
+                self.failures = 0
+                self.failure_limit *= 2
+
+    def solutions(self, limit=None):
+        """
+        Enforce node and arc consistency, and then lazily generate up to
+        `limit` distinct solutions of the CSP (all of them if `limit` is None).
+        """
+        self.enforce_node_consistency()
+        if not self.ac3():
+            return
+        self.trail = []
+        self.used = set()
+        for solution in itertools.islice(self.iter_backtrack(dict()), limit):
+            yield dict(solution)
 
     def enforce_node_consistency(self):
         """
@@ -101,15 +230,49 @@ class CrosswordCreator():
         """
         # print('node consistency:')  # review
         for var in self.crossword.variables:
-            ToRemove = set()  # empty set of words to be removed from each var's domain
-            for word in self.domains[var]:
-                if len(word) != var.length:
-                    ToRemove.add(word)
-            # remove unmatching words from domain
-            for word in ToRemove:
-                self.domains[var].remove(word)
+            # a domain only holds words of one length, so one of the wrong
+            # length has no word to keep
+            if self.domains[var].length != var.length:
+                self.domains[var].mask = 0
             # print(str(var) + '\t\t' + str(self.domains[var]))  # review
 
+    def letter_counts(self, var, position):
+        """
+        Return a dict from each letter to the number of words in the domain
+        of `var` with that letter at `position`, leaving out letters with
+        no words.
+        """
+        index = self.crossword.index
+        domain = self.domains[var].mask
+        counts = dict()
+        for letter in index.letters(var.length, position):
+            count = (domain & index.mask(var.length, position, letter)).bit_count()
+            if count:
+                counts[letter] = count
+        return counts
+
+    def restrict(self, var, mask):
+        """
+        Narrow the domain of `var` to the words in the bitset `mask`,
+        recording its previous words on the trail.
+        Return True if any word was removed.
+        """
+        domain = self.domains[var]
+        narrowed = domain.mask & mask
+        if narrowed == domain.mask:
+            return False
+        self.trail.append((var, domain.mask))
+        domain.mask = narrowed
+        return True
+
+    def undo(self, mark):
+        """
+        Restore every domain change recorded on the trail after `mark`.
+        """
+        while len(self.trail) > mark:
+            var, mask = self.trail.pop()
+            self.domains[var].mask = mask
+
     def revise(self, x, y):
         """
         Make variable `x` arc consistent with variable `y`.
@@ -119,29 +282,36 @@ class CrosswordCreator():
         Return True if a revision was made to the domain of `x`; return
         False if no revision was made.
         """
-        ToRemove = set()  # empty set of x words to be removed from each x's domain.
-
-        # Get overlap cell btw x & y.
-        (i, j) = self.crossword.overlaps[x, y]
+        ToRemove = 0  # bitset of x words to be removed from x's domain.
 
         # if no overlaps, return false.
-        if not (i, j):
+        if not self.crossword.overlaps[x, y]:
             return False
 
-        # if no yword in y's domain satisfy the constraint for (x,y).
-        # constraint is that the overlap cell has the same letter in both variables.
-        for xword in self.domains[x]:
-            ToRemove.add(xword)
-            for yword in self.domains[y] - {xword}:
-                if xword[i] == yword[j]:
-                    ToRemove.remove(xword)
-                    break
+        # Get overlap cell btw x & y.
+        (i, j) = self.crossword.overlaps[x, y]
 
-        for word in ToRemove:
-            self.domains[x].remove(word)
+        # constraint is that the overlap cell has the same letter in both variables,
+        # so an xword is supported by the ywords that share its letter at the overlap.
+        # Intersect the domains with the index's letter bitsets instead of
+        # comparing every xword with every yword.
+        index = self.crossword.index
+        xdomain = self.domains[x].mask
+        ydomain = self.domains[y].mask
+        for letter in index.letters(x.length, i):
+            xwords = xdomain & index.mask(x.length, i, letter)
+            if not xwords:
+                continue
+            ywords = ydomain & index.mask(y.length, j, letter)
+            if not ywords:
+                # no yword has this letter at the overlap
+                ToRemove |= xwords
+            elif ywords & (ywords - 1) == 0 and x.length == y.length and xwords & ywords:
+                # the only support is the same word, which can't be used twice
+                ToRemove |= ywords
 
         # return True of word was removed from x domain.
-        Revised = True if ToRemove else False
+        Revised = self.restrict(x, ~ToRemove)
         return Revised
 
     def ac3(self, arcs=None):
@@ -154,9 +324,11 @@ class CrosswordCreator():
         return False if one or more domains end up empty.
         """
         # if no arcs, start with all the arcs in the problem
-        if not arcs:
+        if arcs is None:
             queue = [(x, y) for (x, y) in self.crossword.overlaps.keys()
                      if self.crossword.overlaps[x, y]]
+        else:
+            queue = list(arcs)
 
         # ac3 algorithm
         while queue:
@@ -171,6 +343,27 @@ class CrosswordCreator():
         # At this point, all domains satisfies arc consistency and return True.
         return True
 
+    def infer(self, var, assignment):
+        """
+        Propagate the assignment of `var` to the domains of its unassigned
+        neighbors according to `self.inference`. Every removal goes through
+        `restrict`, so it can be undone from the trail.
+
+        Return False if some domain ends up empty; return True otherwise.
+        """
+        arcs = [(nbr, var) for nbr in self.crossword.neighbors(var) - assignment.keys()]
+
+        if self.inference == "mac":
+            return self.ac3(arcs)
+
+        if self.inference == "forward":
+            for (x, y) in arcs:
+                self.revise(x, y)
+                if not self.domains[x]:
+                    return False
+
+        return True
+
     def assignment_complete(self, assignment):
         """
         Return True if `assignment` is complete (i.e., assigns a value to each
@@ -182,30 +375,47 @@ class CrosswordCreator():
 
         return True
 
-    def consistent(self, assignment):
+    def consistent(self, assignment, var=None):
         """
         Return True if `assignment` is consistent (i.e., words fit in crossword
         puzzle without conflicting characters); return False otherwise.
+
+        If `var` is given, the rest of `assignment` is assumed to be consistent
+        already and only the word newly assigned to `var` is checked: against
+        `self.used` for distinctness and against its assigned neighbors.
         """
+        if var is not None:
+            word = assignment[var]
 
-        for var1 in assignment.keys():
-            for var2 in assignment.keys():
-                if var1 == var2:
-                    continue
-                # check distinctions
-                if assignment[var1] == assignment[var2]:
-                    return False
+            # check length and distinctions
+            if len(word) != var.length or word in self.used:
+                return False
 
-                # check overlaps
-                if self.crossword.overlaps[var1, var2] != None:
-                    (i, j) = self.crossword.overlaps[var1, var2]
-                    if assignment[var1][i] != assignment[var2][j]:
+            # check overlaps
+            for nbr in self.crossword.neighbors(var):
+                if nbr in assignment:
+                    (i, j) = self.crossword.overlaps[var, nbr]
+                    if word[i] != assignment[nbr][j]:
                         return False
 
+            return True
+
+        # check distinctions
+        if len(set(assignment.values())) != len(assignment):
+            return False
+
+        for var1 in assignment.keys():
             # check length
             if len(assignment[var1]) != var1.length:
                 return False
 
+            # check overlaps
+            for var2 in self.crossword.neighbors(var1):
+                if var2 in assignment:
+                    (i, j) = self.crossword.overlaps[var1, var2]
+                    if assignment[var1][i] != assignment[var2][j]:
+                        return False
+
         return True
 
     def order_domain_values(self, var, assignment):
@@ -216,18 +426,33 @@ class CrosswordCreator():
         that rules out the fewest values among the neighbors of `var`.
         """
 
+        # For each unassigned neighbor, count the neighbor's words by the letter
+        # at the overlap once, so a word's rule-out count is a table lookup.
+        tables = []
+        for nbr in self.crossword.neighbors(var) - assignment.keys():
+            (i, j) = self.crossword.overlaps[var, nbr]
+            histogram = self.letter_counts(nbr, j)
+            tables.append((i, len(self.domains[nbr]), histogram))
+
         def SortFun(word):
-            nbrs = self.crossword.neighbors(var) - assignment.keys()
             rank = 0
-            for nbr in nbrs:
-                (i, j) = self.crossword.overlaps[var, nbr]
-                wrds = list(self.domains[nbr])
-                for wrd in wrds:
-                    if word[i] != wrd[j]:
-                        rank += 1
+            for (i, size, histogram) in tables:
+                rank += size - histogram.get(word[i], 0)
             return rank
 
-        List = list(self.domains[var].copy())
+        List = list(self.domains[var])
+
+        # with a seed, shuffle first so the stable sort breaks ties at random
+        if self.seed is not None:
+            self.random.shuffle(List)
+
+        # for huge domains only score a random sample, and try it first
+        if self.lcv_limit is not None and len(List) > self.lcv_limit:
+            self.random.shuffle(List)
+            Sample = List[:self.lcv_limit]
+            Sample.sort(key=SortFun)
+            return Sample + List[self.lcv_limit:]
+
         List.sort(key=SortFun)
         return List
 
@@ -241,6 +466,10 @@ class CrosswordCreator():
         """
         List = list(self.crossword.variables - assignment.keys())
 
+        # with a seed, shuffle first so the stable sort breaks ties at random
+        if self.seed is not None:
+            self.random.shuffle(List)
+
         def SortFun(var):
             rank = len(self.domains[var])
             rank = rank + len(self.crossword.neighbors(var)) / 100
@@ -258,43 +487,195 @@ class CrosswordCreator():
 
         If no assignment is possible, return None.
         """
+        for solution in self.iter_backtrack(assignment):
+            return solution
+        return None
+
+    def iter_backtrack(self, assignment):
+        """
+        Generate every complete assignment that extends `assignment`, in
+        search order. Each solution is yielded as `assignment` itself, which
+        the search keeps modifying when resumed.
+        """
         if self.assignment_complete(assignment):
-            return assignment
+            yield assignment
+            return
 
         var = self.select_unassigned_variable(assignment)
         for word in self.order_domain_values(var, assignment):
             assignment[var] = word
-            if self.consistent(assignment):
-                result = self.backtrack(assignment)
-                if result:
-                    return assignment
+            if self.consistent(assignment, var):
+                self.used.add(word)
+                mark = len(self.trail)
+
+                # reduce var's domain to the assigned word and propagate
+                self.restrict(var, self.domains[var].bit(word))
+                if self.infer(var, assignment):
+                    yield from self.iter_backtrack(assignment)
+                self.undo(mark)
+                self.used.remove(word)
             assignment.pop(var)
-        return None
 
+        self.failures += 1
+        if self.failure_limit is not None and self.failures > self.failure_limit:
+            raise Restart()
+
+
+def portfolio_worker(task):
+    """
+    Solve the crossword for a `(structure, words, options)` task with one
+    portfolio configuration.
+    Return the configuration and the assignment found, or None.
+    """
+    structure, words, options = task
+    crossword = Crossword(structure, words)
+    creator = CrosswordCreator(crossword, **options)
+    return options, creator.solve()
+
+
+def solve_portfolio(structure, words, configs=None, timeout=None, processes=None):
+    """
+    Race several differently configured solvers for the same crossword in a
+    process pool and return `(options, assignment)` from the first one to
+    find a solution; the other workers are terminated.
+
+    `configs` is a list of `CrosswordCreator` keyword arguments (by default
+    `PORTFOLIO`). Return `(None, None)` if every solver proves there is no
+    solution, and raise TimeoutError if none finishes within `timeout` seconds.
+    """
+    if configs is None:
+        configs = PORTFOLIO
+    deadline = None if timeout is None else time.monotonic() + timeout
+
+    pool = multiprocessing.Pool(processes or len(configs))
+    try:
+        results = pool.imap_unordered(
+            portfolio_worker, [(structure, words, options) for options in configs]
+        )
+        for _ in configs:
+            remaining = None
+            if deadline is not None:
+                remaining = max(0, deadline - time.monotonic())
+            try:
+                options, assignment = results.next(timeout=remaining)
+            except multiprocessing.TimeoutError:
+                raise TimeoutError(f"no solution found within {timeout} seconds")
+            if assignment is not None:
+                return options, assignment
+        return None, None
+    finally:
+        pool.terminate()
+        pool.join()
+
+
+def generate_batch(directory, words, output, limit=1, images=False, workers=4,
+                   pattern="structure*.txt"):
+    """
+    Solve every structure file matching `pattern` in `directory` with the
+    vocabulary in `words`, loading the word index only once. Up to `limit`
+    solutions per structure are written to `output` as text grids named
+    after the structure, plus PNG images if `images` is True, by a pool of
+    `workers` writer threads. Structures without any variables are skipped.
+
+    Return a dict of throughput statistics.
+    """
+    index = WordIndex.from_file(words)
+    os.makedirs(output, exist_ok=True)
+    start = time.perf_counter()
+    structures = 0
+    solutions = 0
+
+    def write(creator, assignment, basename):
+        with open(basename + ".txt", "w") as f:
+            f.write(creator.grid_text(assignment) + "\n")
+        if images:
+            creator.save(assignment, basename + ".png")
+
+    with ThreadPoolExecutor(workers) as executor:
+        writes = []
+        for filename in sorted(os.listdir(directory)):
+            path = os.path.join(directory, filename)
+            if (not os.path.isfile(path)
+                    or not fnmatch.fnmatch(filename, pattern)
+                    or os.path.samefile(path, words)):
+                continue
+            crossword = Crossword(path, words, index=index)
+            if not crossword.variables:
+                continue
+            structures += 1
+            name = os.path.splitext(filename)[0]
+            creator = CrosswordCreator(crossword)
+            for k, assignment in enumerate(creator.solutions(limit)):
+                solutions += 1
+                basename = os.path.join(output, f"{name}-{k}")
+                writes.append(executor.submit(write, creator, assignment, basename))
+        for future in writes:
+            future.result()
+
+    elapsed = time.perf_counter() - start
+    return {
+        "structures": structures,
+        "solutions": solutions,
+        "seconds": elapsed,
+        "solutions_per_second": solutions / elapsed if elapsed else 0.0,
+    }
 
-def main():
 
-    # Check usage
-    if len(sys.argv) not in [3, 4]:
-        sys.exit("Usage: python generate.py structure words [output]")
+def main():
 
     # Parse command-line arguments
-    structure = sys.argv[1]
-    words = sys.argv[2]
-    output = sys.argv[3] if len(sys.argv) == 4 else None
+    parser = argparse.ArgumentParser(
+        usage="python generate.py structure words [output]"
+    )
+    parser.add_argument("structure")
+    parser.add_argument("words")
+    parser.add_argument("output", nargs="?")
+    parser.add_argument("--portfolio", action="store_true",
+                        help="race several solver configurations in parallel")
+    parser.add_argument("--timeout", type=float,
+                        help="wall-clock limit in seconds for --portfolio")
+    parser.add_argument("--batch", action="store_true",
+                        help="solve every structure file in the structure "
+                             "directory and write results to the output directory")
+    parser.add_argument("--solutions", type=int, default=1,
+                        help="number of distinct solutions per structure for --batch")
+    parser.add_argument("--images", action="store_true",
+                        help="also save PNG images for --batch")
+    args = parser.parse_args()
+
+    # Generate crosswords for a whole directory of structures
+    if args.batch:
+        if not args.output:
+            sys.exit("--batch requires an output directory")
+        stats = generate_batch(
+            args.structure, args.words, args.output,
+            limit=args.solutions, images=args.images
+        )
+        print(f"{stats['structures']} structures, {stats['solutions']} solutions "
+              f"in {stats['seconds']:.2f}s "
+              f"({stats['solutions_per_second']:.1f} solutions/s)")
+        return
 
     # Generate crossword
-    crossword = Crossword(structure, words)
+    crossword = Crossword(args.structure, args.words)
     creator = CrosswordCreator(crossword)
-    assignment = creator.solve()
+    if args.portfolio:
+        try:
+            _, assignment = solve_portfolio(
+                args.structure, args.words, timeout=args.timeout
+            )
+        except TimeoutError as e:
+            sys.exit(str(e))
+    else:
+        assignment = creator.solve()
 
     # Print result
     if assignment is None:
         print("No solution.")
     else:
         creator.print(assignment)
-        if output:
-            creator.save(assignment, output)
+        if args.output:
+            creator.save(assignment, args.output)
 
 
 if __name__ == "__main__":
@@ -2,6 +2,8 @@ import csv
 import itertools
 import sys
 
+import numpy as np
+
 PROBS = {
 
     # Unconditional probabilities for having gene
@@ -36,13 +38,88 @@ PROBS = {
     "mutation": 0.01
 }
 
+# Number of gene assignments evaluated at once by `brute_force`
+BLOCK_SIZE = 2 ** 16
+
+# Largest number of people in one clique `infer` will build a table for
+MAX_CLIQUE_SIZE = 15
+
 
 def main():
 
     # Check for proper usage
-    if len(sys.argv) != 2:
-        sys.exit("Usage: python heredity.py data.csv")
-    people = load_data(sys.argv[1])
+    if len(sys.argv) == 3 and sys.argv[2] == "--brute-force":
+        people = load_data(sys.argv[1])
+        probabilities = brute_force(people)
+    elif len(sys.argv) == 3 and sys.argv[2] == "--enumerate":
+        people = load_data(sys.argv[1])
+        probabilities = enumerate_probabilities(people)
+    elif len(sys.argv) == 2:
+        people = load_data(sys.argv[1])
+        probabilities = infer(people)
+    else:
+        sys.exit("Usage: python heredity.py data.csv [--brute-force | --enumerate]")
+
+    # Print results
+    for person in people:
+        print(f"{person}:")
+        for field in probabilities[person]:
+            print(f"  {field.capitalize()}:")
+            for value in probabilities[person][field]:
+                p = probabilities[person][field][value]
+                print(f"    {value}: {p:.4f}")
+
+
+def brute_force(people, block=BLOCK_SIZE):
+    """
+    Return the gene and trait probabilities of every person in `people`
+    by evaluating the joint probability of every assignment of genes,
+    `block` assignments at a time.
+
+    Assignment `k` gives each person the gene count of the matching base 3
+    digit of `k`. Unknown traits are summed out per assignment rather than
+    enumerated, as they only depend on their owner's genes.
+    """
+    names = list(people)
+    index = {name: i for i, name in enumerate(names)}
+    founders = [
+        index[name] for name in names
+        if not people[name]["mother"] or not people[name]["father"]
+    ]
+    children = [index[name] for name in names if index[name] not in founders]
+    mothers = [index[people[names[i]]["mother"]] for i in children]
+    fathers = [index[people[names[i]]["father"]] for i in children]
+    observed = [index[name] for name in names if people[name]["trait"] is not None]
+    traits = [int(people[names[i]]["trait"]) for i in observed]
+
+    totals = np.zeros((len(names), 3))
+    rows = np.arange(len(names))
+    powers = 3 ** np.arange(len(names))
+    count = 3 ** len(names)
+    for start in range(0, count, block):
+        codes = np.arange(start, min(start + block, count))
+        genes = codes[:, None] // powers % 3
+
+        p = GENES[genes[:, founders]].prod(axis=1)
+        p *= INHERITANCE[
+            genes[:, mothers], genes[:, fathers], genes[:, children]
+        ].prod(axis=1)
+        p *= TRAIT[genes[:, observed], traits].prod(axis=1)
+
+        np.add.at(totals, (rows, genes), p[:, None])
+
+    return {
+        name: distribution(people[name], totals[i] / totals[i].sum())
+        for i, name in enumerate(names)
+    }
+
+
+def enumerate_probabilities(people):
+    """
+    Return the gene and trait probabilities of every person in `people`
+    by enumerating every assignment of genes and traits consistent with
+    the known traits, one `joint_probability` at a time.
+    """
 
     # Keep track of gene and trait probabilities for each person
     probabilities = {
@@ -60,38 +137,211 @@ def main():
         for person in people
     }
 
-    # Loop over all sets of people who might have the trait
-    names = set(people)
-    for have_trait in powerset(names):
+    # Loop over all assignments consistent with known information
+    for one_gene, two_genes, have_trait in assignments(people):
+
+        # Update probabilities with new joint probability
+        p = joint_probability(people, one_gene, two_genes, have_trait)
+        update(probabilities, one_gene, two_genes, have_trait, p)
+
+    # Ensure probabilities sum to 1
+    normalize(probabilities)
+    return probabilities
+
 
-        # Check if current set of people violates known information
-        fails_evidence = any(
-            (people[person]["trait"] is not None and
-             people[person]["trait"] != (person in have_trait))
-            for person in names
+def infer(people):
+    """
+    Return the gene and trait probabilities of every person in `people`,
+    computed exactly by message passing on the pedigree's Bayesian network.
+
+    Traits only depend on their owner's genes, so known traits become
+    evidence factors on gene counts and unknown traits are summed out.
+    The gene variables are eliminated one at a time (`elimination_order`),
+    which builds a tree of cliques; one pass up the tree and one pass down
+    it then gives every person's gene distribution, in time linear in the
+    number of people for pedigrees with few loops.
+
+    Raise ValueError if a clique would have more than `MAX_CLIQUE_SIZE`
+    people, since its table needs 3 ** size entries; `brute_force` then
+    still works in bounded memory.
+    """
+    names = list(people)
+    factors = [person_factor(people, name) for name in names]
+    order, size = elimination_order(factors)
+    if size > MAX_CLIQUE_SIZE:
+        raise ValueError(
+            f"Pedigree needs a clique of {size} people (at most {MAX_CLIQUE_SIZE} "
+            "supported); use brute_force instead"
         )
-        if fails_evidence:
-            continue
+    position = {name: k for k, name in enumerate(order)}
+
+    # Assign each factor to the bucket of its first eliminated variable
+    buckets = [[] for _ in order]
+    for factor in factors:
+        buckets[min(position[v] for v in factor[0])].append(factor)
+
+    # Upward pass: eliminate variables in order, sending each bucket's
+    # message to the bucket of the first variable it still mentions
+    upward = [None] * len(order)
+    children = [[] for _ in order]
+    parents = [None] * len(order)
+    for k, var in enumerate(order):
+        incoming = buckets[k] + [upward[c] for c in children[k]]
+        scope, table = factor_product(incoming)
+        message = sum_out((scope, table), var)
+        upward[k] = message
+        if message[0]:
+            parent = min(position[v] for v in message[0])
+            parents[k] = parent
+            children[parent].append(k)
+
+    # Downward pass: combine each bucket with the message from its parent
+    # to get its clique's distribution, then pass messages to its children
+    downward = [None] * len(order)
+    probabilities = dict()
+    for k in reversed(range(len(order))):
+        var = order[k]
+        received = buckets[k] + [upward[c] for c in children[k]]
+        if downward[k] is not None:
+            received = received + [downward[k]]
+
+        marginal = marginalize(factor_product(received), (var,))[1]
+        marginal = marginal / marginal.sum()
+        probabilities[var] = distribution(people[var], marginal)
+
+        for c in children[k]:
+            # Start from a uniform factor over the child's separator, since
+            # the other factors need not mention all of its variables
+            separator = upward[c][0]
+            others = [(separator, np.ones((3,) * len(separator)))]
+            others += buckets[k] + [upward[d] for d in children[k] if d != c]
+            if downward[k] is not None:
+                others.append(downward[k])
+            downward[c] = marginalize(factor_product(others), separator)
+
+    return {name: probabilities[name] for name in names}
+
+
+def person_factor(people, name):
+    """
+    Return the factor `(scope, table)` over the gene counts of `name`'s
+    mother and father (if known) and `name`, giving the probability of
+    `name`'s gene count and, if known, their trait.
+    """
+    person = people[name]
+    if not person["mother"] or not person["father"]:
+        scope = (name,)
+        table = GENES
+    else:
+        scope = (person["mother"], person["father"], name)
+        table = INHERITANCE
 
-        # Loop over all sets of people who might have the gene
-        for one_gene in powerset(names):
-            for two_genes in powerset(names - one_gene):
+    if person["trait"] is not None:
+        table = table * TRAIT[:, int(person["trait"])]
+    return scope, table
 
-                # Update probabilities with new joint probability
-                p = joint_probability(people, one_gene, two_genes, have_trait)
-                update(probabilities, one_gene, two_genes, have_trait, p)
 
-    # Ensure probabilities sum to 1
-    normalize(probabilities)
+def inheritance_table():
+    """
+    Return the 3 x 3 x 3 table of the probability that a child has a
+    number of copies of the gene, given the mother's and father's counts.
+    """
+    # probability that a parent with g copies passes the gene on
+    passes = [PROBS["mutation"], 0.5, 1 - PROBS["mutation"]]
+    table = np.zeros((3, 3, 3))
+    for mother in range(3):
+        for father in range(3):
+            m = passes[mother]
+            f = passes[father]
+            table[mother, father] = [
+                (1 - m) * (1 - f),
+                m * (1 - f) + (1 - m) * f,
+                m * f
+            ]
+    return table
+
+
+def distribution(person, gene):
+    """
+    Return the gene and trait distributions of `person` given the
+    distribution `gene` over their number of copies of the gene.
+    """
+    if person["trait"] is not None:
+        trait = {True: float(person["trait"]), False: float(not person["trait"])}
+    else:
+        has_trait = gene @ TRAIT[:, 1]
+        trait = {True: float(has_trait), False: float(1 - has_trait)}
+    return {
+        "gene": {2: float(gene[2]), 1: float(gene[1]), 0: float(gene[0])},
+        "trait": trait
+    }
 
-    # Print results
-    for person in people:
-        print(f"{person}:")
-        for field in probabilities[person]:
-            print(f"  {field.capitalize()}:")
-            for value in probabilities[person][field]:
-                p = probabilities[person][field][value]
-                print(f"    {value}: {p:.4f}")
+
+def elimination_order(factors):
+    """
+    Return an order in which to eliminate the variables of `factors`,
+    greedily choosing the variable with the fewest neighbors in the graph
+    linking variables that share a factor, and the size of the largest
+    clique that order creates.
+    """
+    neighbors = dict()
+    for scope, _ in factors:
+        for v in scope:
+            neighbors.setdefault(v, set()).update(u for u in scope if u != v)
+
+    order = []
+    size = 0
+    while neighbors:
+        var = min(neighbors, key=lambda v: (len(neighbors[v]), v))
+        adjacent = neighbors.pop(var)
+        for v in adjacent:
+            neighbors[v].discard(var)
+            neighbors[v].update(u for u in adjacent if u != v)
+        order.append(var)
+        size = max(size, len(adjacent) + 1)
+    return order, size
+
+
+def factor_product(factors):
+    """
+    Return the product of `factors` as a factor whose scope lists their
+    variables in order of first appearance.
+    """
+    scope = []
+    for variables, _ in factors:
+        scope.extend(v for v in variables if v not in scope)
+
+    table = np.ones((3,) * len(scope))
+    for variables, values in factors:
+        axes = [variables.index(v) for v in scope if v in variables]
+        shape = [3 if v in variables else 1 for v in scope]
+        table = table * np.transpose(values, axes).reshape(shape)
+    return tuple(scope), table
+
+
+def marginalize(factor, keep):
+    """
+    Return `factor` summed over every variable not in `keep`, with its
+    scope ordered as `keep`. The table is rescaled to a maximum of 1, which
+    keeps long products from underflowing and does not change the
+    normalized results.
+    """
+    scope, table = factor
+    axes = tuple(k for k, v in enumerate(scope) if v not in keep)
+    table = table.sum(axis=axes)
+    remaining = [v for v in scope if v in keep]
+    table = np.transpose(table, [remaining.index(v) for v in keep])
+    largest = table.max()
+    if largest > 0:
+        table = table / largest
+    return tuple(keep), table
+
+
+def sum_out(factor, var):
+    """
+    Return `factor` summed over the variable `var`.
+    """
+    return marginalize(factor, tuple(v for v in factor[0] if v != var))
 
 
 def load_data(filename):
@@ -118,14 +368,34 @@ def load_data(filename):
 
 def powerset(s):
     """
-    Return a list of all possible subsets of set s.
+    Yield all possible subsets of set s.
     """
     s = list(s)
-    return [
-        set(s) for s in itertools.chain.from_iterable(
-            itertools.combinations(s, r) for r in range(len(s) + 1)
-        )
-    ]
+    for subset in itertools.chain.from_iterable(
+        itertools.combinations(s, r) for r in range(len(s) + 1)
+    ):
+        yield set(subset)
+
+
+def assignments(people):
+    """
+    Yield every `(one_gene, two_genes, have_trait)` assignment consistent
+    with the known traits in `people`.
+
+    People with a known trait are fixed up front, so only the traits of the
+    others are enumerated, and assignments are generated lazily one at a
+    time rather than built as lists of sets.
+    """
+    names = list(people)
+    known = {name for name in names if people[name]["trait"]}
+    unknown = [name for name in names if people[name]["trait"] is None]
+
+    for traits in powerset(unknown):
+        have_trait = known | traits
+        for genes in itertools.product((0, 1, 2), repeat=len(names)):
+            one_gene = {name for name, g in zip(names, genes) if g == 1}
+            two_genes = {name for name, g in zip(names, genes) if g == 2}
+            yield one_gene, two_genes, have_trait
 
 
 def joint_probability(people, one_gene, two_genes, have_trait):
@@ -142,8 +412,9 @@ def joint_probability(people, one_gene, two_genes, have_trait):
     # import math
     # assess how many genes every person has in that state
     gene = dict()
+    have_gene = one_gene | two_genes
     for person_name in people.keys():
-        if person_name not in one_gene | two_genes:
+        if person_name not in have_gene:
             gene[person_name] = 0
         elif person_name in one_gene:
             gene[person_name] = 1
@@ -195,8 +466,9 @@ def update(probabilities, one_gene, two_genes, have_trait, p):
     Which value for each distribution is updated depends on whether
     the person is in `have_gene` and `have_trait`, respectively.
     """
+    have_gene = one_gene | two_genes
     for person_name in probabilities.keys():
-        if person_name not in one_gene | two_genes:
+        if person_name not in have_gene:
             probabilities[person_name]["gene"][0] += p
             probabilities[person_name]["trait"][person_name in have_trait] += p
         elif person_name in one_gene:
@@ -224,5 +496,15 @@ def normalize(probabilities):
         probabilities[person_name]["trait"][False] *= nt
 
 
+# Unconditional probability of each gene count
+GENES = np.array([PROBS["gene"][g] for g in range(3)])
+
+# Probability of a child's gene count given its parents' gene counts
+INHERITANCE = inheritance_table()
+
+# Probability of not having and having the trait given each gene count
+TRAIT = np.array([[PROBS["trait"][g][False], PROBS["trait"][g][True]] for g in range(3)])
+
+
 if __name__ == "__main__":
     main()
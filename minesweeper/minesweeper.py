@@ -89,23 +89,84 @@ class Sentence():
     Logical statement about a Minesweeper game
     A sentence consists of a set of board cells,
     and a count of the number of those cells which are mines.
+
+    Cells are stored as bits of an integer mask, where cell (i, j)
+    is bit `i * width + j` for a board `width` cells wide, so subset,
+    difference and intersection tests between sentences are single
+    integer operations.
     """
 
-    def __init__(self, cells, count):
-        self.cells = set(cells)
+    __slots__ = ("mask", "count", "width")
+
+    def __init__(self, cells, count, width):
+        self.width = width
+        self.mask = 0
+        for cell in cells:
+            self.mask |= self.bit(cell)
         self.count = count
 
+    @classmethod
+    def from_mask(cls, mask, count, width):
+        """
+        Creates a sentence directly from an already encoded cell mask.
+        """
+        sentence = cls((), count, width)
+        sentence.mask = mask
+        return sentence
+
+    def bit(self, cell):
+        """
+        Returns the mask bit that encodes `cell`.
+        """
+        i, j = cell
+        if not 0 <= j < self.width or i < 0:
+            raise ValueError(f"Cell {cell} is outside a board {self.width} cells wide")
+        return 1 << (i * self.width + j)
+
+    @property
+    def cells(self):
+        """
+        Returns the set of (i, j) cells encoded in the mask.
+        """
+        cells = set()
+        mask = self.mask
+        while mask:
+            low = mask & -mask
+            cells.add(divmod(low.bit_length() - 1, self.width))
+            mask ^= low
+        return cells
+
+    def __len__(self):
+        return bin(self.mask).count("1")
+
     def __eq__(self, other):
-        return self.cells == other.cells and self.count == other.count
+        return self.mask == other.mask and self.count == other.count
 
     def __str__(self):
         return f"{self.cells} = {self.count}"
 
+    def is_superset(self, other):
+        """
+        Returns True if `other`'s cells are a proper subset of self's cells.
+        """
+        return self.mask != other.mask and other.mask & ~self.mask == 0
+
+    def difference(self, other):
+        """
+        Returns the sentence inferred by removing `other`'s cells
+        (and mines) from this sentence.
+        """
+        return Sentence.from_mask(
+            self.mask & ~other.mask,
+            self.count - other.count,
+            self.width
+        )
+
     def known_mines(self):
         """
         Returns the set of all cells in self.cells known to be mines.
         """
-        if len(self.cells) == self.count:
+        if len(self) == self.count:
             return self.cells
         return set()
 
@@ -122,8 +183,9 @@ class Sentence():
         Updates internal knowledge representation given the fact that
         a cell is known to be a mine.
         """
-        if cell in self.cells:
-            self.cells.remove(cell)
+        bit = self.bit(cell)
+        if self.mask & bit:
+            self.mask &= ~bit
             self.count -= 1
 
     def mark_safe(self, cell):
@@ -131,8 +193,7 @@ class Sentence():
         Updates internal knowledge representation given the fact that
         a cell is known to be safe.
         """
-        if cell in self.cells:
-            self.cells.remove(cell)
+        self.mask &= ~self.bit(cell)
 
 
 class MinesweeperAI():
@@ -197,7 +258,7 @@ class MinesweeperAI():
 
         # add a new sentence to the AI's knowledge base based on the value of `cell` and `count`
         neighbors, mines_removed = self.neighbors(cell)
-        sentence = Sentence(neighbors, count-mines_removed)
+        sentence = Sentence(neighbors, count-mines_removed, self.width)
         self.knowledge.append(sentence)
 
         # mark any additional cells as safe or as mines
@@ -218,13 +279,10 @@ class MinesweeperAI():
                 if sentence1 == sentence2:
                     continue
 
-                if sentence1.cells > sentence2.cells:
+                if sentence1.is_superset(sentence2):
                     print(1)
                     loop = True
-                    new_sentence = Sentence(
-                        sentence1.cells - sentence2.cells,
-                        sentence1.count - sentence2.count
-                    )
+                    new_sentence = sentence1.difference(sentence2)
                     sentence_to_del.append(sentence1)
                 else:
                     continue
@@ -260,7 +318,7 @@ class MinesweeperAI():
                 for safe in safes:
                     self.mark_safe(safe)
 
-                if len(sentence.cells) == 0:
+                if not sentence.mask:
                     self.knowledge.remove(sentence)
                     s -= 1
             s += 1
@@ -268,7 +326,7 @@ class MinesweeperAI():
         # remove empty sentence
         sentences = self.knowledge.copy()
         for sentence in sentences:
-            if not sentence.cells:
+            if not sentence.mask:
                 self.knowledge.remove(sentence)
 
         if loop:
@@ -0,0 +1,224 @@
+"""
+Vectorized Q-learning for Nim.
+
+States and actions are encoded as dense integer indices, so the Q-table
+is a NumPy array and many training games can be played in lockstep.
+"""
+import numpy as np
+
+from nim import LinearNimAI, NimAI
+
+
+class StateSpace():
+    """
+    Dense integer encoding of the Nim states and actions reachable
+    from the `initial` piles.
+
+    A state is the mixed-radix number whose digits are the pile sizes,
+    and an action `(i, j)` is numbered in order of `i`, then `j`.
+
+    If `canonical` is True, the space matches `NimAI(canonical=True)`:
+    piles are kept sorted, every move leads to the sorted resulting piles,
+    and only the first of several equal piles may be taken from.
+    """
+
+    def __init__(self, initial=[1, 3, 5, 7], canonical=False):
+        self.canonical = canonical
+        self.initial = sorted(initial) if canonical else list(initial)
+        radix = np.array(self.initial) + 1
+        self.strides = np.concatenate(([1], np.cumprod(radix[:-1])))
+        self.num_states = int(np.prod(radix))
+
+        self.actions = [
+            (i, j)
+            for i, pile in enumerate(self.initial)
+            for j in range(1, pile + 1)
+        ]
+        self.action_index = {action: a for a, action in enumerate(self.actions)}
+        self.num_actions = len(self.actions)
+
+        # Tables indexed by state (and action): the piles of each state,
+        # which actions are legal in it, and the state each action leads to
+        states = np.arange(self.num_states)
+        action_pile = np.array([i for i, _ in self.actions])
+        action_count = np.array([j for _, j in self.actions])
+        self.piles = (states[:, None] // self.strides) % radix
+        self.legal = self.piles[:, action_pile] >= action_count
+        self.next_state = np.where(
+            self.legal,
+            states[:, None] - action_count * self.strides[action_pile],
+            -1
+        )
+        if canonical:
+            first = np.ones(self.piles.shape, dtype=bool)
+            first[:, 1:] = self.piles[:, 1:] != self.piles[:, :-1]
+            self.legal &= first[:, action_pile]
+            sorted_piles = np.sort(self.piles[self.next_state], axis=-1)
+            self.next_state = np.where(
+                self.legal, sorted_piles @ self.strides, -1
+            )
+        self.initial_state = self.encode(self.initial)
+
+    def encode(self, piles):
+        """
+        Return the index of the state with the given `piles`.
+        """
+        return int(np.dot(piles, self.strides))
+
+    def decode(self, state):
+        """
+        Return the piles of the state with index `state`.
+        """
+        return self.piles[state].tolist()
+
+    def best_future_reward(self, q, states):
+        """
+        Return, for each state index in `states`, the maximum Q-value of its
+        legal actions in the table `q`, as `NimAI.best_future_reward` does:
+        0 if there are no actions, and never less than 0.
+        """
+        values = np.where(self.legal[states], q[states], -np.inf)
+        return np.maximum(values.max(axis=1), 0)
+
+    def from_q_dict(self, q_dict):
+        """
+        Return the Q-table and visited mask encoding the `NimAI.q`
+        dictionary `q_dict`.
+        Raise ValueError if an entry is not a legal move in this space.
+        """
+        q = np.zeros((self.num_states, self.num_actions))
+        visited = np.zeros(q.shape, dtype=bool)
+        radix = np.array(self.initial) + 1
+        for (state, action), value in q_dict.items():
+            if (len(state) != len(self.initial)
+                    or not all(0 <= pile < r for pile, r in zip(state, radix))
+                    or action not in self.action_index
+                    or not self.legal[self.encode(state), self.action_index[action]]):
+                raise ValueError(
+                    f"Q-table entry {(state, action)} does not fit games "
+                    f"started from piles {self.initial}"
+                )
+            s, a = self.encode(state), self.action_index[action]
+            q[s, a] = value
+            visited[s, a] = True
+        return q, visited
+
+    def to_q_dict(self, q, visited):
+        """
+        Return the entries of the table `q` marked in `visited` as a
+        `NimAI.q` dictionary keyed by `(state, action)` tuples.
+        """
+        return {
+            (tuple(self.decode(s)), self.actions[a]): float(q[s, a])
+            for s, a in zip(*np.nonzero(visited))
+        }
+
+
+def update(space, q, visited, states, actions, new_states, rewards, alpha):
+    """
+    Apply a batch of Q-learning updates to the table `q`.
+    Updates of the same `(state, action)` pair within the batch are
+    averaged rather than compounded, since they all start from the
+    same old value.
+    """
+    if not len(states):
+        return
+    old = q[states, actions]
+    delta = rewards + space.best_future_reward(q, new_states) - old
+
+    pairs, inverse = np.unique(
+        states * space.num_actions + actions, return_inverse=True
+    )
+    sums = np.bincount(inverse, weights=delta)
+    counts = np.bincount(inverse)
+    q.reshape(-1)[pairs] += alpha * sums / counts
+    visited.reshape(-1)[pairs] = True
+
+
+def play_batch(space, q, visited, size, alpha, epsilon, rng):
+    """
+    Play `size` training games of self-play in lockstep,
+    updating the table `q` after every round of moves.
+    """
+    games = np.arange(size)
+    state = np.full(size, space.initial_state)
+    player = np.zeros(size, dtype=int)
+
+    # Keep track of last move made by either player in each game
+    last_state = np.full((2, size), -1)
+    last_action = np.full((2, size), -1)
+
+    while games.size:
+        s = state[games]
+        legal = space.legal[s]
+
+        # Epsilon-greedy choice, breaking ties between best actions at random
+        values = np.where(legal, q[s], -np.inf)
+        ties = values == values.max(axis=1, keepdims=True)
+        greedy = np.argmax(rng.random(ties.shape) * ties, axis=1)
+        explore = np.argmax(rng.random(legal.shape) * legal, axis=1)
+        a = np.where(rng.random(games.size) < epsilon, explore, greedy)
+
+        # Keep track of last state and action, and make moves
+        p = player[games]
+        last_state[p, games] = s
+        last_action[p, games] = a
+        ns = space.next_state[s, a]
+        other = 1 - p
+        player[games] = other
+        over = ns == 0
+
+        # A finished game costs the mover -1 and rewards the other player
+        # with 1; otherwise the other player's last move gets no reward yet
+        prev_state = last_state[other, games]
+        prev_action = last_action[other, games]
+        has_prev = prev_state >= 0
+        update(
+            space, q, visited,
+            np.concatenate((s[over], prev_state[has_prev])),
+            np.concatenate((a[over], prev_action[has_prev])),
+            np.concatenate((ns[over], ns[has_prev])),
+            np.concatenate((
+                np.full(np.count_nonzero(over), -1.0),
+                np.where(over[has_prev], 1.0, 0.0)
+            )),
+            alpha
+        )
+
+        state[games] = ns
+        games = games[~over]
+
+
+def train_batch(n, initial=None, batch=1024, alpha=0.5, epsilon=0.1,
+                report=10000, seed=None, player=None):
+    """
+    Train an AI by playing `n` games against itself, `batch` games at a time,
+    printing progress every `report` games (never if `report` is None).
+    If `player` is given, e.g. loaded from a checkpoint, resume training it
+    with its own `alpha` and `epsilon`, by default on the piles it was
+    trained on. Otherwise games start from [1, 3, 5, 7] by default.
+    """
+    if player is None:
+        player = NimAI(alpha=alpha, epsilon=epsilon)
+    elif isinstance(player, LinearNimAI):
+        raise TypeError("train_batch needs a tabular NimAI, not a LinearNimAI")
+    alpha, epsilon = player.alpha, player.epsilon
+    initial = initial or player.initial or [1, 3, 5, 7]
+    space = StateSpace(initial, canonical=player.canonical)
+    q, visited = space.from_q_dict(player.q)
+    rng = np.random.default_rng(seed)
+
+    played = 0
+    while played < n:
+        size = min(batch, n - played)
+        play_batch(space, q, visited, size, alpha, epsilon, rng)
+        if report and (played + size) // report > played // report:
+            print(f"Played {played + size} training games")
+        played += size
+
+    print("Done training")
+
+    # Return the trained AI
+    player.q = space.to_q_dict(q, visited)
+    player.initial = space.initial
+    return player
@@ -0,0 +1,58 @@
+"""
+Micro-benchmark for the cached Nim action tables.
+
+Usage: python benchmark.py [games]
+"""
+import contextlib
+import io
+import sys
+import time
+import timeit
+
+from nim import Nim, action_set, action_tuple, train
+
+
+def uncached_actions(piles):
+    """
+    Build the set of available actions from scratch, as
+    Nim.available_actions did before it was cached.
+    """
+    actions = set()
+    for i, pile in enumerate(piles):
+        for j in range(1, pile + 1):
+            actions.add((i, j))
+    return actions
+
+
+def main():
+    games = int(sys.argv[1]) if len(sys.argv) == 2 else 10000
+
+    # Every state reachable from the initial piles
+    states = [
+        [a, b, c, d]
+        for a in range(2) for b in range(4) for c in range(6) for d in range(8)
+    ]
+
+    def run(function):
+        for piles in states:
+            function(piles)
+
+    number = 200
+    uncached = timeit.timeit(lambda: run(uncached_actions), number=number)
+    action_set.cache_clear()
+    action_tuple.cache_clear()
+    cached = timeit.timeit(lambda: run(Nim.available_actions), number=number)
+    calls = number * len(states)
+    print(f"available_actions uncached: {uncached / calls * 1e6:.2f} us/call")
+    print(f"available_actions cached:   {cached / calls * 1e6:.2f} us/call "
+          f"({uncached / cached:.1f}x)")
+
+    start = time.perf_counter()
+    with contextlib.redirect_stdout(io.StringIO()):
+        train(games)
+    elapsed = time.perf_counter() - start
+    print(f"train({games}): {elapsed:.2f}s ({games / elapsed:.0f} games/s)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,138 @@
+"""
+Headless evaluation of trained NimAI policies.
+
+Plays each AI against a random player, the perfect player and itself
+over many games in a process pool, and reports win rates and throughput
+along with each trainer's training time and Q-table footprint.
+
+Usage: python evaluate.py [training games] [evaluation games]
+"""
+import contextlib
+import io
+import multiprocessing
+import random
+import sys
+import time
+
+from nim import LinearNimAI, Nim, NimAI, perfect_action, train
+
+OPPONENTS = ["random", "perfect", "self"]
+
+
+def play_games(task):
+    """
+    Play a `(ai, opponent, games, initial, seed)` task and return the number
+    of games the AI won. The AI moves first in every other game, except
+    against "self", where the wins of the first player are counted.
+    """
+    ai, opponent, games, initial, seed = task
+    random.seed(seed)
+    wins = 0
+    for k in range(games):
+        game = Nim(initial)
+        ai_player = 0 if opponent == "self" else k % 2
+        while game.winner is None:
+            if game.player == ai_player or opponent == "self":
+                action = ai.choose_action(game.piles, epsilon=False)
+            elif opponent == "random":
+                action = random.choice(Nim.action_list(game.piles))
+            else:
+                action = perfect_action(game.piles)
+            game.move(action)
+        wins += game.winner == ai_player
+    return wins
+
+
+def evaluate(ai, opponent, games=1000, initial=[1, 3, 5, 7], processes=None,
+             seed=0):
+    """
+    Play `games` games of `ai` against `opponent` ("random", "perfect" or
+    "self") split across a pool of `processes` workers.
+    Return a dict with the win rate and the number of games per second.
+    """
+    if opponent not in OPPONENTS:
+        raise ValueError(f"Unknown opponent {opponent!r}")
+    processes = processes or multiprocessing.cpu_count()
+    chunks = min(games, processes * 4)
+    tasks = [
+        (ai, opponent, games // chunks + (1 if k < games % chunks else 0),
+         initial, seed + k)
+        for k in range(chunks)
+    ]
+
+    start = time.perf_counter()
+    with multiprocessing.Pool(processes) as pool:
+        wins = sum(pool.map(play_games, tasks))
+    elapsed = time.perf_counter() - start
+    return {"win_rate": wins / games, "games_per_second": games / elapsed}
+
+
+def footprint(obj, seen=None):
+    """
+    Return an estimate in bytes of the memory held by `obj` and the
+    containers and values it references.
+    """
+    if seen is None:
+        seen = set()
+    if id(obj) in seen:
+        return 0
+    seen.add(id(obj))
+    size = sys.getsizeof(obj)
+    if isinstance(obj, dict):
+        size += sum(footprint(k, seen) + footprint(v, seen) for k, v in obj.items())
+    elif isinstance(obj, (list, tuple, set, frozenset)):
+        size += sum(footprint(item, seen) for item in obj)
+    return size
+
+
+def model_size(ai):
+    """
+    Return the memory footprint in bytes of what `ai` has learned.
+    """
+    if isinstance(ai, LinearNimAI):
+        return footprint(ai.weights)
+    return footprint(ai.q)
+
+
+def trainers(n):
+    """
+    Return the trainer variants to compare, as a dict from name to a
+    function training an AI with `n` games.
+    """
+    def batch():
+        from batch import train_batch
+        return train_batch(n, report=None)
+
+    def parallel():
+        from parallel import train_parallel
+        return train_parallel(n)
+
+    return {
+        "train": lambda: train(n),
+        "train canonical": lambda: train(n, NimAI(canonical=True)),
+        "train linear": lambda: train(n, LinearNimAI()),
+        "train_batch": batch,
+        "train_parallel": parallel,
+    }
+
+
+def main():
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 10000
+    games = int(sys.argv[2]) if len(sys.argv) > 2 else 2000
+
+    for name, trainer in trainers(n).items():
+        start = time.perf_counter()
+        with contextlib.redirect_stdout(io.StringIO()):
+            ai = trainer()
+        elapsed = time.perf_counter() - start
+
+        print(f"{name}: trained {n} games in {elapsed:.2f}s, "
+              f"model {model_size(ai) / 1024:.1f} KiB")
+        for opponent in OPPONENTS:
+            result = evaluate(ai, opponent, games)
+            print(f"    vs {opponent:8} win rate {result['win_rate']:6.1%}, "
+                  f"{result['games_per_second']:.0f} games/s")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,8 +1,13 @@
+import functools
 import math
 import random
 import time
 
 
+# Number of states whose available actions are cached
+ACTION_CACHE_SIZE = 65536
+
+
 class Nim():
 
     def __init__(self, initial=[1, 3, 5, 7]):
@@ -25,12 +30,19 @@ class Nim():
 
         Action `(i, j)` represents the action of removing `j` items
         from pile `i` (where piles are 0-indexed).
+
+        The set is cached per state and shared between callers,
+        so it is returned as a frozenset.
         """
-        actions = set()
-        for i, pile in enumerate(piles):
-            for j in range(1, pile + 1):
-                actions.add((i, j))
-        return actions
+        return action_set(tuple(piles))
+
+    @classmethod
+    def action_list(cls, piles):
+        """
+        Nim.action_list(piles) returns the same actions as
+        Nim.available_actions(piles), as a cached tuple in a fixed order.
+        """
+        return action_tuple(tuple(piles))
 
     @classmethod
     def other_player(cls, player):
@@ -70,9 +82,74 @@ class Nim():
             self.winner = self.player
 
 
+@functools.lru_cache(maxsize=ACTION_CACHE_SIZE)
+def action_tuple(piles):
+    """
+    Return the tuple of available actions `(i, j)` for the `piles` tuple.
+    """
+    return tuple(
+        (i, j)
+        for i, pile in enumerate(piles)
+        for j in range(1, pile + 1)
+    )
+
+
+@functools.lru_cache(maxsize=ACTION_CACHE_SIZE)
+def action_set(piles):
+    """
+    Return the frozenset of available actions `(i, j)` for the `piles` tuple.
+    """
+    return frozenset(action_tuple(piles))
+
+
+def perfect_action(piles):
+    """
+    Return an optimal action `(i, j)` for `piles` under this game's rule
+    that whoever takes the last object loses (misère Nim).
+
+    Play as in normal Nim, moving to a nim-sum of 0, unless the move
+    would leave no pile larger than 1; then leave an odd number of piles
+    of size 1. In a losing position, take one object from the first pile.
+    """
+    big = [i for i, pile in enumerate(piles) if pile > 1]
+
+    # Moving on the last big pile decides how many piles of size 1 remain
+    if len(big) == 1:
+        i = big[0]
+        ones = sum(1 for pile in piles if pile == 1)
+        keep = 0 if ones % 2 == 1 else 1
+        return (i, piles[i] - keep)
+
+    if len(big) > 1:
+        nim_sum = 0
+        for pile in piles:
+            nim_sum ^= pile
+        for i, pile in enumerate(piles):
+            if pile ^ nim_sum < pile:
+                return (i, pile - (pile ^ nim_sum))
+
+    for i, pile in enumerate(piles):
+        if pile:
+            return (i, 1)
+
+
+@functools.lru_cache(maxsize=ACTION_CACHE_SIZE)
+def canonical_form(piles):
+    """
+    Return the `piles` tuple sorted in increasing order, together with
+    the index in that order of each pile of `piles`. Piles of equal size
+    all map to the first of them, so equivalent actions share one key.
+    """
+    ordered = tuple(sorted(piles))
+    first = dict()
+    for k, pile in enumerate(ordered):
+        first.setdefault(pile, k)
+    return ordered, tuple(first[pile] for pile in piles)
+
+
 class NimAI():
 
-    def __init__(self, alpha=0.5, epsilon=0.1):
+    def __init__(self, alpha=0.5, epsilon=0.1, canonical=False):
         """
         Initialize AI with an empty Q-learning dictionary,
         an alpha (learning) rate, and an epsilon rate.
@@ -81,10 +158,68 @@ class NimAI():
         pairs to a Q-value (a number).
          - `state` is a tuple of remaining piles, e.g. (1, 1, 4, 4)
          - `action` is a tuple `(i, j)` for an action
+
+        If `canonical` is True, states are stored with their piles sorted
+        and actions mapped to match (see `canonical_form`), so states that
+        are permutations of each other share Q-values.
+
+        `initial` records the piles of the games the AI was trained on,
+        once training has set it.
         """
         self.q = dict()
         self.alpha = alpha
         self.epsilon = epsilon
+        self.canonical = canonical
+        self.initial = None
+
+    def save(self, filename, initial=None):
+        """
+        Save the Q-learning table to `filename` as a NumPy archive holding
+        dense arrays indexed by state and action for games started
+        from the `initial` piles, by default those the AI was trained on.
+        """
+        import numpy as np
+        from batch import StateSpace
+
+        initial = initial or self.initial or [1, 3, 5, 7]
+        space = StateSpace(initial, canonical=self.canonical)
+        q, visited = space.from_q_dict(self.q)
+        np.savez(
+            filename,
+            initial=np.array(space.initial), q=q, visited=visited,
+            alpha=self.alpha, epsilon=self.epsilon, canonical=self.canonical
+        )
+
+    @classmethod
+    def load(cls, filename):
+        """
+        Load an AI saved with `NimAI.save`.
+        """
+        import numpy as np
+        from batch import StateSpace
+
+        with np.load(filename) as checkpoint:
+            canonical = bool(checkpoint.get("canonical", False))
+            space = StateSpace(checkpoint["initial"].tolist(), canonical=canonical)
+            ai = cls(
+                alpha=float(checkpoint["alpha"]),
+                epsilon=float(checkpoint["epsilon"]),
+                canonical=canonical
+            )
+            ai.initial = space.initial
+            ai.q = space.to_q_dict(checkpoint["q"], checkpoint["visited"])
+        return ai
+
+    def key(self, state, action):
+        """
+        Return the key of the state `state` and the action `action`
+        in `self.q`.
+        """
+        if not self.canonical:
+            return tuple(state), action
+        piles, index = canonical_form(tuple(state))
+        i, j = action
+        return piles, (index[i], j)
 
     def update(self, old_state, action, new_state, reward):
         """
@@ -101,11 +236,7 @@ class NimAI():
         Return the Q-value for the state `state` and the action `action`.
         If no Q-value exists yet in `self.q`, return 0.
         """
-        try:
-            q_value = self.q[tuple(state),action]
-            return q_value
-        except:
-            return 0
+        return self.q.get(self.key(state, action), 0)
 
     def update_q_value(self, state, action, old_q, reward, future_rewards):
         """
@@ -122,7 +253,7 @@ class NimAI():
         `alpha` is the learning rate, and `new value estimate`
         is the sum of the current reward and estimated future rewards.
         """
-        self.q[tuple(state), action] = old_q + self.alpha * (reward+future_rewards - old_q)
+        self.q[self.key(state, action)] = old_q + self.alpha * (reward+future_rewards - old_q)
 
     def best_future_reward(self, state):
         """
@@ -135,7 +266,7 @@ class NimAI():
         `state`, return 0.
         """
         best_reward = 0
-        for action in Nim.available_actions(state):
+        for action in Nim.action_list(state):
             best_reward = max(best_reward, self.get_q_value(state, action))
 
         return best_reward
@@ -156,8 +287,9 @@ class NimAI():
         options is an acceptable return value.
         """
         # get values of all available actions
+        actions = Nim.action_list(state)
         actions_q_values = dict()
-        for action in Nim.available_actions(state):
+        for action in actions:
             actions_q_values[action] = self.get_q_value(state, action)
 
         method = random.choices(["best_action", "random_action"], weights=[1-self.epsilon, self.epsilon], k=1)[0]
@@ -167,20 +299,115 @@ class NimAI():
             max_q = max(actions_q_values.values())
             return random.choice([action for action, q in actions_q_values.items() if q == max_q])
         elif method == "random_action":
-            return random.choice(list(Nim.available_actions(state)))
+            return random.choice(actions)
         
 
-def train(n):
+class LinearNimAI(NimAI):
+    """
+    Q-learning AI whose Q-value for `(state, action)` is a linear function
+    of features of the position the action leads to. Memory is a fixed
+    weight vector, however many states the piles allow.
+    """
+
+    def __init__(self, alpha=0.05, epsilon=0.1, bits=8):
+        """
+        Initialize AI with zero weights for the features of `features`,
+        where nim-sums are described by their lowest `bits` bits.
+        """
+        super().__init__(alpha=alpha, epsilon=epsilon)
+        self.bits = bits
+        self.weights = [0.0] * (6 + bits)
+
+    def save(self, filename, initial=None):
+        """
+        Save the weights to `filename` as a NumPy archive.
+        """
+        import numpy as np
+        np.savez(
+            filename, weights=np.array(self.weights), bits=self.bits,
+            alpha=self.alpha, epsilon=self.epsilon
+        )
+
+    @classmethod
+    def load(cls, filename):
+        """
+        Load an AI saved with `LinearNimAI.save`.
+        """
+        import numpy as np
+        with np.load(filename) as checkpoint:
+            ai = cls(
+                alpha=float(checkpoint["alpha"]),
+                epsilon=float(checkpoint["epsilon"]),
+                bits=int(checkpoint["bits"])
+            )
+            ai.weights = checkpoint["weights"].tolist()
+        return ai
+
+    def features(self, state, action):
+        """
+        Return the feature vector of taking `action` in `state`,
+        describing the resulting piles by their nim-sum, how many piles
+        are larger than 1, and the parity of the piles of size 1.
+        """
+        i, j = action
+        nim_sum = 0
+        big = 0
+        ones = 0
+        for k, pile in enumerate(state):
+            if k == i:
+                pile -= j
+            nim_sum ^= pile
+            if pile > 1:
+                big += 1
+            elif pile == 1:
+                ones += 1
+        odd = ones % 2
+        return [
+            1.0,
+            float(nim_sum == 0),
+            float(big == 0),
+            float(odd),
+            float(big == 0 and odd),
+            float(big > 0 and nim_sum == 0),
+        ] + [float(nim_sum >> b & 1) for b in range(self.bits)]
+
+    def get_q_value(self, state, action):
+        """
+        Return the Q-value for the state `state` and the action `action`.
+        """
+        return sum(
+            w * f for w, f in zip(self.weights, self.features(state, action))
+        )
+
+    def update_q_value(self, state, action, old_q, reward, future_rewards):
+        """
+        Move the weights along the features of `(state, action)` by
+        `alpha` times the difference between the new value estimate
+        `reward + future_rewards` and the old estimate `old_q`.
+        """
+        step = self.alpha * (reward + future_rewards - old_q)
+        for k, f in enumerate(self.features(state, action)):
+            self.weights[k] += step * f
+
+
+def train(n, player=None, initial=None):
     """
-    Train an AI by playing `n` games against itself.
+    Train an AI by playing `n` games against itself, starting from the
+    `initial` piles.
+    If `player` is given, e.g. loaded from a checkpoint, resume training it,
+    by default on the piles it was trained on. Otherwise games start from
+    [1, 3, 5, 7] by default.
     """
 
-    player = NimAI()
+    if player is None:
+        player = NimAI()
+    initial = list(initial or player.initial or [1, 3, 5, 7])
+    player.initial = initial
 
     # Play n games
     for i in range(n):
         print(f"Playing training game {i + 1}")
-        game = Nim()
+        game = Nim(initial)
 
         # Keep track of last move made by either player
         last = {
@@ -229,9 +456,9 @@ def train(n):
     return player
 
 
-def play(ai, human_player=None):
+def play(ai, human_player=None, initial=[1, 3, 5, 7]):
     """
-    Play human game against the AI.
+    Play human game against the AI, starting from the `initial` piles.
     `human_player` can be set to 0 or 1 to specify whether
     human player moves first or second.
     """
@@ -241,7 +468,7 @@ def play(ai, human_player=None):
         human_player = random.randint(0, 1)
 
     # Create new game
-    game = Nim()
+    game = Nim(initial)
 
     # Game loop
     while True:
@@ -0,0 +1,135 @@
+"""
+Multi-process self-play training for NimAI.
+
+Each worker plays games on a private snapshot of a Q-table held in shared
+memory and periodically merges its changes back into the shared table.
+
+Usage: python parallel.py [games] [workers]
+"""
+import contextlib
+import io
+import multiprocessing
+import random
+import sys
+import time
+from multiprocessing import shared_memory
+
+import numpy as np
+
+from batch import StateSpace, play_batch
+from evaluate import evaluate
+from nim import NimAI, train
+
+
+def worker(name, shape, lock, initial, games, sync, batch, alpha, epsilon,
+           scale, seed):
+    """
+    Play `games` training games, `sync` games per round. Each round starts
+    from a snapshot of the shared table and ends by adding the change to the
+    snapshot, multiplied by `scale`, back into the shared table.
+    """
+    shm = shared_memory.SharedMemory(name=name)
+    try:
+        table = np.ndarray(shape, dtype=np.float64, buffer=shm.buf)
+        q, visited = table[0], table[1]
+        space = StateSpace(initial)
+        rng = np.random.default_rng(seed)
+
+        played = 0
+        while played < games:
+            size = min(sync, games - played)
+            with lock:
+                snapshot = q.copy()
+            local = snapshot.copy()
+            local_visited = np.zeros(local.shape, dtype=bool)
+
+            done = 0
+            while done < size:
+                count = min(batch, size - done)
+                play_batch(space, local, local_visited, count, alpha, epsilon, rng)
+                done += count
+
+            with lock:
+                q += scale * (local - snapshot)
+                visited[local_visited] = 1
+            played += size
+        del table, q, visited
+    finally:
+        shm.close()
+
+
+def train_parallel(n, workers=None, initial=[1, 3, 5, 7], sync=1000,
+                   batch=256, alpha=0.5, epsilon=0.1, merge="delta", seed=None):
+    """
+    Train an AI by playing `n` games of self-play split across `workers`
+    processes (by default one per CPU), merging every `sync` games.
+
+    With `merge="delta"` each worker's change is added to the shared table
+    as is; with `merge="average"` it is divided by the number of workers.
+    """
+    if merge not in ("delta", "average"):
+        raise ValueError(f"Unknown merge mode {merge!r}")
+    workers = workers or multiprocessing.cpu_count()
+    space = StateSpace(initial)
+    shape = (2, space.num_states, space.num_actions)
+    scale = 1 / workers if merge == "average" else 1
+
+    shm = shared_memory.SharedMemory(create=True, size=int(np.prod(shape)) * 8)
+    try:
+        table = np.ndarray(shape, dtype=np.float64, buffer=shm.buf)
+        table[:] = 0
+        lock = multiprocessing.Lock()
+        seeds = np.random.SeedSequence(seed).spawn(workers)
+
+        processes = []
+        for k in range(workers):
+            games = n // workers + (1 if k < n % workers else 0)
+            process = multiprocessing.Process(target=worker, args=(
+                shm.name, shape, lock, initial, games, sync, batch,
+                alpha, epsilon, scale, seeds[k]
+            ))
+            process.start()
+            processes.append(process)
+        for process in processes:
+            process.join()
+            if process.exitcode != 0:
+                raise RuntimeError(f"Training worker failed with exit code {process.exitcode}")
+
+        q = space.to_q_dict(table[0], table[1] > 0)
+        del table
+    finally:
+        shm.close()
+        shm.unlink()
+
+    # Return the trained AI
+    player = NimAI(alpha=alpha, epsilon=epsilon)
+    player.q = q
+    player.initial = space.initial
+    return player
+
+
+def main():
+    games = int(sys.argv[1]) if len(sys.argv) > 1 else 10000
+    workers = int(sys.argv[2]) if len(sys.argv) > 2 else multiprocessing.cpu_count()
+    random.seed(0)
+
+    start = time.perf_counter()
+    with contextlib.redirect_stdout(io.StringIO()):
+        serial = train(games)
+    serial_time = time.perf_counter() - start
+
+    start = time.perf_counter()
+    parallel = train_parallel(games, workers=workers, seed=0)
+    parallel_time = time.perf_counter() - start
+
+    serial_wins = evaluate(serial, "perfect")["win_rate"]
+    parallel_wins = evaluate(parallel, "perfect")["win_rate"]
+    print(f"serial train:   {serial_time:.2f}s, "
+          f"win rate vs perfect {serial_wins:.1%}")
+    print(f"parallel train: {parallel_time:.2f}s with {workers} workers, "
+          f"win rate vs perfect {parallel_wins:.1%}")
+    print(f"speedup: {serial_time / parallel_time:.1f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,4 +1,14 @@
-from nim import train, play
+import os
+import sys
 
-ai = train(10000)
+from nim import NimAI, train, play
+
+# Pretrained policy, created by the first run or with --retrain
+CHECKPOINT = "nim.npz"
+
+if os.path.exists(CHECKPOINT) and "--retrain" not in sys.argv:
+    ai = NimAI.load(CHECKPOINT)
+else:
+    ai = train(10000)
+    ai.save(CHECKPOINT)
 play(ai)
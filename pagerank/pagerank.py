@@ -1,16 +1,38 @@
+import hashlib
 import os
 import random
 import re
 import sys
+from array import array
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+from scipy import sparse
+from scipy.sparse import linalg
 
 DAMPING = 0.85
 SAMPLES = 10000
 
+# Norms available to measure convergence
+NORMS = {"max": np.inf, "l1": 1, "l2": 2}
+
+# Pattern of a link in an HTML page
+LINK = re.compile(r"<a\s+(?:[^>]*?)href=\"([^\"]*)\"")
+
 
 def main():
+    if len(sys.argv) == 3 and sys.argv[2] == "--incremental":
+        ranks, stats = update_pagerank(sys.argv[1], DAMPING)
+        print(f"PageRank Results from Incremental Update "
+              f"({stats['changed']} changed pages, {stats['pushes']} pushes, "
+              f"{stats['iterations']} iterations)")
+        for page in sorted(ranks):
+            print(f"  {page}: {ranks[page]:.4f}")
+        return
     if len(sys.argv) != 2:
-        sys.exit("Usage: python pagerank.py corpus")
-    corpus = crawl(sys.argv[1])
+        sys.exit("Usage: python pagerank.py corpus [--incremental]")
+    corpus = Graph.from_edges(*crawl_edges(sys.argv[1], report=10000))
     ranks = sample_pagerank(corpus, DAMPING, SAMPLES)
     print(f"PageRank Results from Sampling (n = {SAMPLES})")
     for page in sorted(ranks):
@@ -27,90 +49,282 @@ def crawl(directory):
     Return a dictionary where each key is a page, and values are
     a list of all other pages in the corpus that are linked to by the page.
     """
-    pages = dict()
+    pages, sources, targets = crawl_edges(directory)
+    corpus = {page: set() for page in pages}
+    for i, j in zip(sources.tolist(), targets.tolist()):
+        corpus[pages[i]].add(pages[j])
+    return corpus
 
-    # Extract all links from HTML files
-    for filename in os.listdir(directory):
-        if not filename.endswith(".html"):
-            continue
-        with open(os.path.join(directory, filename)) as f:
-            contents = f.read()
-            links = re.findall(r"<a\s+(?:[^>]*?)href=\"([^\"]*)\"", contents)
-            pages[filename] = set(links) - {filename}
-
-    # Only include links to other pages in the corpus
-    for filename in pages:
-        pages[filename] = set(
-            link for link in pages[filename]
-            if link in pages
+
+def crawl_edges(directory, processes=None, report=None):
+    """
+    Parse a directory of HTML pages in a pool of `processes` worker
+    processes, printing progress every `report` pages if given.
+
+    Return the sorted list of page names, and two int32 NumPy arrays
+    `sources` and `targets` of page numbers, where each
+    `(sources[k], targets[k])` is a link between two different pages of
+    the corpus. Links are ordered by source, then target.
+    """
+    pages = sorted(
+        filename for filename in os.listdir(directory)
+        if filename.endswith(".html")
+    )
+    index = {page: i for i, page in enumerate(pages)}
+    paths = [os.path.join(directory, page) for page in pages]
+
+    sources = array("i")
+    targets = array("i")
+    workers = processes or os.cpu_count() or 1
+    chunksize = max(1, len(paths) // (4 * workers))
+    with ProcessPoolExecutor(workers) as executor:
+        results = executor.map(extract_links, paths, chunksize=chunksize)
+        for i, links in enumerate(results):
+            # Only include links to other pages in the corpus
+            linked = sorted(index[link] for link in links if link in index)
+            targets.extend(j for j in linked if j != i)
+            sources.extend([i] * (len(targets) - len(sources)))
+            if report and (i + 1) % report == 0:
+                print(f"Crawled {i + 1} of {len(pages)} pages")
+    return (
+        pages,
+        np.frombuffer(sources, dtype=np.intc).astype(np.int32, copy=False),
+        np.frombuffer(targets, dtype=np.intc).astype(np.int32, copy=False)
+    )
+
+
+def extract_links(path, chunk_size=65536):
+    """
+    Return the set of link targets in the HTML file at `path`, reading it
+    in chunks of `chunk_size` characters rather than all at once.
+    """
+    links = set()
+    tail = ""
+    with open(path) as f:
+        while True:
+            chunk = f.read(chunk_size)
+            buffer = tail + chunk
+            links.update(LINK.findall(buffer))
+            if not chunk:
+                return links
+
+            # carry over a tag that may continue in the next chunk
+            start = buffer.rfind("<")
+            tail = buffer[start:] if start >= 0 and ">" not in buffer[start:] else ""
+
+
+class Graph():
+    """
+    Immutable link structure of a crawled corpus.
+
+    Pages are numbered in corpus order. Links are held as compressed
+    sparse rows: the outbound links of page i are
+    `targets[offsets[i]:offsets[i + 1]]` and its inbound links
+    `sources[in_offsets[i]:in_offsets[i + 1]]`, in increasing order.
+    Pages without links are listed in `dangling`.
+    """
+
+    def __init__(self, corpus):
+        pages = tuple(corpus.keys())
+        index = {page: i for i, page in enumerate(pages)}
+        sources = array("i")
+        targets = array("i")
+        for i, page in enumerate(pages):
+            targets.extend(sorted(index[link] for link in corpus[page]))
+            sources.extend([i] * (len(targets) - len(sources)))
+        self.set_links(pages, np.asarray(sources), np.asarray(targets))
+
+    @classmethod
+    def from_edges(cls, pages, sources, targets):
+        """
+        Create a graph from a list of page names and the page numbers of
+        the `sources` and `targets` of its links, as `crawl_edges` returns.
+        Duplicate links are counted once.
+        """
+        N = len(pages)
+        edges = (
+            np.asarray(sources, dtype=np.int64) * N
+            + np.asarray(targets, dtype=np.int64)
         )
-    return pages
+        # crawled links usually come sorted and distinct already
+        if np.any(edges[1:] <= edges[:-1]):
+            edges = np.unique(edges)
+        graph = cls.__new__(cls)
+        graph.set_links(tuple(pages), edges // N, edges % N)
+        return graph
+
+    def set_links(self, pages, sources, targets):
+        """
+        Set up the graph for the `pages` names and the arrays of `sources`
+        and `targets` of its links, sorted by source, then target.
+        """
+        N = len(pages)
+        sources = np.asarray(sources, dtype=np.int32)
+        targets = np.asarray(targets, dtype=np.int32)
+        self.pages = pages
+        self.index = {page: i for i, page in enumerate(self.pages)}
+
+        self.out_degree = np.bincount(sources, minlength=N)
+        self.offsets = np.zeros(N + 1, dtype=np.int64)
+        np.cumsum(self.out_degree, out=self.offsets[1:])
+        self.targets = targets
+        self.dangling = np.flatnonzero(self.out_degree == 0)
+
+        order = np.argsort(targets, kind="stable")
+        self.in_offsets = np.zeros(N + 1, dtype=np.int64)
+        np.cumsum(np.bincount(targets, minlength=N), out=self.in_offsets[1:])
+        self.sources = sources[order]
+        self.matrix = None
+
+    def __len__(self):
+        return len(self.pages)
+
+    def keys(self):
+        return self.pages
+
+    def __getitem__(self, page):
+        """Return the set of pages linked to by `page`, like a corpus."""
+        return set(self.pages[j] for j in self.outbound(self.index[page]).tolist())
+
+    def outbound(self, i):
+        """
+        Return the array of page numbers linked to by page `i`.
+        """
+        return self.targets[self.offsets[i]:self.offsets[i + 1]]
+
+    def inbound(self, i):
+        """
+        Return the array of page numbers linking to page `i`.
+        """
+        return self.sources[self.in_offsets[i]:self.in_offsets[i + 1]]
+
+    def link_arrays(self):
+        """
+        Return the outbound links as two NumPy arrays `offsets` and
+        `targets`, where the links of page i are
+        `targets[offsets[i]:offsets[i + 1]]`.
+        """
+        return self.offsets, self.targets
+
+    def transition_matrix(self):
+        """
+        Return the sparse CSR matrix `M` where `M[j, i]` is the probability
+        of following a link from page i to page j, built on first use.
+
+        Columns of dangling pages are left empty; `power_iteration` spreads
+        their rank over all pages instead of storing a dense column.
+        """
+        if self.matrix is None:
+            N = len(self.pages)
+            # the outbound links are the columns of M in compressed form
+            degree = np.maximum(self.out_degree, 1)
+            values = np.repeat(1 / degree, self.out_degree)
+            self.matrix = sparse.csc_matrix(
+                (values, self.targets, self.offsets), shape=(N, N)
+            ).tocsr()
+        return self.matrix
+
+
+def as_graph(corpus):
+    """
+    Return `corpus` as a `Graph`, building one if it is a corpus dictionary.
+    """
+    if isinstance(corpus, Graph):
+        return corpus
+    return Graph(corpus)
 
 
-def transition_model(corpus, page, damping_factor):
+def transition_model(corpus, page, damping_factor, teleport=None):
     """
     Return a probability distribution over which page to visit next,
     given a current page.
 
     With probability `damping_factor`, choose a link at random
     linked to by `page`. With probability `1 - damping_factor`, choose
-    a link at random chosen from all pages in the corpus.
-    """
+    a link at random chosen from all pages in the corpus, or according
+    to the `teleport` distribution if given (see `teleport_vector`).
 
-    all_pages = corpus.keys()
-    N = len(all_pages)
+    `corpus` may be a dictionary or a `Graph`. A teleport distribution
+    needs a `Graph`, which is built from a dictionary on every call, so
+    callers asking about many pages should pass a `Graph` instead.
+    """
 
-    linked_pages = corpus[page]
+    if teleport is None and not isinstance(corpus, Graph):
+        # a single uniform query only needs the page's own links
+        pages = corpus.keys()
+        linked_pages = corpus[page]
+    else:
+        graph = as_graph(corpus)
+        pages = graph.pages
+        linked_pages = [pages[j] for j in graph.outbound(graph.index[page]).tolist()]
+    N = len(pages)
     n = len(linked_pages)
 
     # if a page has no links, pretend it has links to all pages in the corpus, including itself.
     if n == 0:
-        linked_pages = all_pages
+        linked_pages = pages
         n = N
 
-    PD = dict()
-
-    # loop over all pages in the corpus
-    for this_page in all_pages:
-        # calculate its probability and add it to the PD dictionary
-        if this_page in linked_pages:
-            PD[this_page] = damping_factor/n + (1-damping_factor)/N
-        else:
-            PD[this_page] = (1-damping_factor)/N
+    # every page gets the random jump probability, and linked pages also a share of the links
+    if teleport is None:
+        PD = dict.fromkeys(pages, (1-damping_factor)/N)
+    else:
+        jump = teleport_vector(graph, teleport)
+        PD = dict(zip(pages, ((1-damping_factor) * jump).tolist()))
+    for linked_page in linked_pages:
+        PD[linked_page] += damping_factor/n
 
     return PD
 
 
-def sample_pagerank(corpus, damping_factor, n):
+def sample_pagerank(corpus, damping_factor, n, walkers=None, burn_in=50):
     """
     Return PageRank values for each page by sampling `n` pages
     according to transition model, starting with a page at random.
 
+    The samples are drawn by `walkers` independent random surfers moving
+    in lockstep (by default one per 100 samples, at most 10000). Each
+    surfer starts at a random page and takes `burn_in` unrecorded steps
+    first, so the short walks are not biased towards their starting pages.
+
     Return a dictionary where keys are page names, and values are
     their estimated PageRank value (a value between 0 and 1). All
     PageRank values should sum to 1.
     """
-    all_pages = list(corpus.keys())
-    samples = []
-
-    # first iteration
-    current_page = random.choice(all_pages)
-    samples.append(current_page)
-
-    for i in range(1, n):
-        # get probability distrubution of all pages from the current_page
-        PD = transition_model(corpus, current_page, damping_factor)
-
-        # get random page given all pages and thier probability distribution
-        current_page = random.choices(all_pages, weights=PD.values(), k=1)[0]
-
-        # append this page to the samples list
-        samples.append(current_page)
+    graph = as_graph(corpus)
+    N = len(graph)
+    offsets, targets = graph.link_arrays()
+    degree = np.diff(offsets)
+    if walkers is None:
+        walkers = max(1, min(10000, n // 100))
+    rng = np.random.default_rng(random.getrandbits(64))
+
+    def step(current):
+        # follow a random link with probability `damping_factor`, unless the page
+        # has none; otherwise jump to a page chosen at random from all pages
+        follow = (rng.random(walkers) < damping_factor) & (degree[current] > 0)
+        pages = rng.integers(N, size=walkers)
+        links = current[follow]
+        choice = offsets[links] + (rng.random(links.size) * degree[links]).astype(int)
+        pages[follow] = targets[choice]
+        return pages
+
+    current = rng.integers(N, size=walkers)
+    for i in range(burn_in):
+        current = step(current)
+
+    # count visits of each page, walker by walker until `n` samples are drawn
+    counts = np.zeros(N, dtype=np.int64)
+    taken = 0
+    while True:
+        k = min(walkers, n - taken)
+        counts += np.bincount(current[:k], minlength=N)
+        taken += k
+        if taken >= n:
+            break
+        current = step(current)
 
-    # calculate ranks of each page and store its as a value to a dictionary
-    ranks = dict()
-    for page in all_pages:
-        ranks[page] = samples.count(page)/n
+    ranks = dict(zip(graph.pages, (counts / n).tolist()))
 
     print("no of samples: " + str(n))
     print("Sum of sampled ranks: " +
@@ -118,104 +332,547 @@ def sample_pagerank(corpus, damping_factor, n):
     return ranks
 
 
-def iterate_pagerank(corpus, damping_factor):
+def iterate_pagerank(corpus, damping_factor, tolerance=0.001, norm="max",
+                     max_iterations=1000, solver="power"):
     """
     Return PageRank values for each page by iteratively updating
     PageRank values until convergence.
 
+    Convergence is reached when the change in the rank vector between
+    two iterations, measured by `norm` ("max", "l1" or "l2"), is below
+    `tolerance`, or after `max_iterations` iterations. `solver` is one of:
+        - "power": plain power iteration
+        - "aitken" or "quadratic": power iteration with periodic
+          Aitken or quadratic extrapolation
+        - "gauss-seidel": in-place updates using already updated ranks
+        - "direct": a sparse linear solve, best suited to small graphs
+
     Return a dictionary where keys are page names, and values are
     their estimated PageRank value (a value between 0 and 1). All
     PageRank values should sum to 1.
     """
-    # get all pages name and how many
-    all_pages = list(corpus.keys())
-    N = len(all_pages)
+    graph = as_graph(corpus)
+    matrix = graph.transition_matrix()
+    dangling = graph.dangling
+
+    if solver in ("power", "aitken", "quadratic"):
+        ranks, i = power_iteration(
+            matrix, dangling, damping_factor, tolerance, norm, max_iterations,
+            extrapolation=None if solver == "power" else solver
+        )
+    elif solver == "gauss-seidel":
+        ranks, i = gauss_seidel(
+            matrix, dangling, damping_factor, tolerance, norm, max_iterations
+        )
+    elif solver == "direct":
+        ranks, i = direct_solve(matrix, dangling, damping_factor)
+    else:
+        raise ValueError(f"Unknown solver {solver!r}")
 
-    # initiatize ranks values to be 1/N
-    old_ranks = dict()
-    for page in all_pages:
-        old_ranks[page] = 1/N
+    print("no of iterations: " + str(i))
+    print("residual: " + str(residual(matrix, dangling, damping_factor, ranks, norm)))
+    print("Sum of iterate ranks: " + str(ranks.sum()))
+    return dict(zip(graph.pages, ranks.tolist()))
 
-    # iterate to solve the equation until solution converge
-    new_ranks = dict()
-    i = 1
-    while True:
-        i += 1
-        # empty uncertainty list for each page
-        e = []
-
-        # calculate new ranks for all pages
-        for page in all_pages:
-            # calculate new rank for current page
-            new_ranks[page] = PR(corpus, page, old_ranks, damping_factor)
-            # append new uncertainity to the list
-            e.append(abs(new_ranks[page] - old_ranks[page]))
-
-        # update old ranks to be used in the next iteration
-        old_ranks = new_ranks.copy()
-
-        # check convergance criteria
-        e = max(e)
-        if e < 0.001:
+
+def pagerank_step(matrix, dangling, damping_factor, ranks):
+    """
+    Return one step of the PageRank equation applied to `ranks`: the random
+    jump share plus the rank passed along the links of `matrix`, with the
+    rank of the `dangling` pages spread evenly over all pages.
+    """
+    N = matrix.shape[0]
+    return (
+        (1 - damping_factor) / N
+        + damping_factor * (matrix @ ranks + ranks[dangling].sum() / N)
+    )
+
+
+def residual(matrix, dangling, damping_factor, ranks, norm="max"):
+    """
+    Return the norm of the difference between `ranks` and one step of
+    the PageRank equation applied to it.
+    """
+    step = pagerank_step(matrix, dangling, damping_factor, ranks)
+    return float(np.linalg.norm(step - ranks, ord=NORMS[norm]))
+
+
+def power_iteration(matrix, dangling, damping_factor, tolerance=0.001,
+                    norm="max", max_iterations=1000, extrapolation=None,
+                    period=10, ranks=None):
+    """
+    Return the PageRank vector for the transition matrix `matrix` and
+    the indices of `dangling` pages, and the number of iterations taken,
+    starting from the estimate `ranks` if given.
+
+    Each iteration is one sparse matrix-vector product plus a rank-one
+    correction for dangling pages, whose rank is spread evenly over all
+    pages as if they linked to every page.
+
+    If `extrapolation` is "aitken" or "quadratic", every `period`
+    iterations the last iterates are extrapolated to cancel the slowest
+    decaying error terms.
+    """
+    if norm not in NORMS:
+        raise ValueError(f"Unknown norm {norm!r}")
+
+    N = matrix.shape[0]
+    ranks = np.full(N, 1 / N) if ranks is None else ranks
+    history = []
+    for i in range(1, max_iterations + 1):
+        new_ranks = pagerank_step(matrix, dangling, damping_factor, ranks)
+        delta = np.linalg.norm(new_ranks - ranks, ord=NORMS[norm])
+        ranks = new_ranks
+        if delta < tolerance:
             break
 
-    print("no of iterations: " + str(i))
-    print("Sum of iterate ranks: " +
-          str(sum(new_ranks[p] for p in list(new_ranks.keys()))))
-    return new_ranks
+        if extrapolation is not None:
+            history = history[-3:] + [ranks]
+            if i % period == 0 and len(history) == 4:
+                ranks = extrapolate(history, extrapolation)
+                history = []
+    return ranks, i
 
 
-def PR(corpus, page, ranks, damping_factor):
+def extrapolate(history, method):
+    """
+    Return an improved estimate of the limit of the iterates in `history`,
+    the last four power iterates, by Aitken's delta-squared process applied
+    to each page or by quadratic extrapolation (Kamvar et al., 2003).
     """
-    Return page rank value using other pages' ranks exiting in the corpus
+    if method == "aitken":
+        x0, x1, x2 = history[-3:]
+        second = x2 - 2 * x1 + x0
+        safe = np.abs(second) > 1e-15
+        ranks = x2.copy()
+        ranks[safe] -= (x2[safe] - x1[safe]) ** 2 / second[safe]
+    elif method == "quadratic":
+        x0, x1, x2, x3 = history
+        Y = np.column_stack((x1 - x0, x2 - x0))
+        (g1, g2), *_ = np.linalg.lstsq(Y, -(x3 - x0), rcond=None)
+        ranks = (g1 + g2 + 1) * x1 + (g2 + 1) * x2 + x3
+    else:
+        raise ValueError(f"Unknown extrapolation {method!r}")
+
+    # keep the estimate a probability distribution
+    ranks = np.maximum(ranks, 0)
+    return ranks / ranks.sum()
+
+
+def gauss_seidel(matrix, dangling, damping_factor, tolerance=0.001,
+                 norm="max", max_iterations=1000):
+    """
+    Return the PageRank vector and the number of sweeps taken, updating
+    the ranks in place in page order so each update uses the ranks already
+    updated in the same sweep.
 
-    Return an integer represent page rank
+    A sweep is one sparse triangular solve; the rank spread from dangling
+    pages is taken from the previous sweep.
     """
-    # get all pages that links to that page
-    links = links_to(corpus, page)
+    if norm not in NORMS:
+        raise ValueError(f"Unknown norm {norm!r}")
+
+    N = matrix.shape[0]
+    lower = (
+        sparse.identity(N, format="csr")
+        - damping_factor * sparse.tril(matrix, k=0, format="csr")
+    ).tocsr()
+    upper = sparse.triu(matrix, k=1, format="csr")
+
+    ranks = np.full(N, 1 / N)
+    for i in range(1, max_iterations + 1):
+        rhs = pagerank_step(upper, dangling, damping_factor, ranks)
+        new_ranks = linalg.spsolve_triangular(lower, rhs, lower=True)
+        delta = np.linalg.norm(new_ranks - ranks, ord=NORMS[norm])
+        ranks = new_ranks
+        if delta < tolerance:
+            break
+    return ranks / ranks.sum(), i
 
-    # claculate summation value in the equation
-    s = 0
-    for link in links:
-        s = s + ranks[link] / NumLinks(corpus, link)
 
-    page_rank = (1-damping_factor)/len(corpus.keys()) + damping_factor * s
+def direct_solve(matrix, dangling, damping_factor):
+    """
+    Return the exact PageRank vector, solving the linear system
+    `(I - d M - d/N 1 e^T) x = (1 - d)/N 1` with a sparse LU factorization
+    of `I - d M`, where `e` marks the dangling pages. The dense rank-one
+    term is handled with the Sherman-Morrison formula. Return 1 as the
+    number of iterations.
+    """
+    N = matrix.shape[0]
+    lu = linalg.splu(
+        (sparse.identity(N, format="csc") - damping_factor * matrix).tocsc()
+    )
+    y = lu.solve(np.full(N, (1 - damping_factor) / N))
+    z = lu.solve(np.ones(N))
+    v = np.zeros(N)
+    v[dangling] = damping_factor / N
+    ranks = y + z * (v @ y) / (1 - v @ z)
+    return ranks, 1
+
+
+def personalized_pagerank(corpus, damping_factor, teleports, tolerance=1e-6,
+                          norm="max", max_iterations=1000):
+    """
+    Return personalized PageRank values, where the random jumps made with
+    probability `1 - damping_factor` land according to a given teleport
+    distribution instead of uniformly.
+
+    `teleports` is either one teleport distribution or a list of them.
+    A distribution is a dictionary from page names to weights, a set or
+    frozenset of seed pages to jump to uniformly, or a single page name;
+    within a list, any other collection of page names is a seed set too.
+    All rank vectors are computed together, iterating on an N x K matrix
+    holding one column per distribution, until every column changes by
+    less than `tolerance` in `norm`.
+
+    Return a ranks dictionary for a single distribution, or a list of them.
+    """
+    graph = as_graph(corpus)
+    single = isinstance(teleports, (dict, set, frozenset, str))
+    if single:
+        teleports = [teleports]
+    if norm not in NORMS:
+        raise ValueError(f"Unknown norm {norm!r}")
+
+    jumps = np.column_stack([teleport_vector(graph, t) for t in teleports])
+    ranks, i = personalized_iteration(
+        graph.transition_matrix(), graph.dangling,
+        damping_factor, jumps, tolerance, norm, max_iterations
+    )
 
-    return page_rank
+    results = [dict(zip(graph.pages, column.tolist())) for column in ranks.T]
+    return results[0] if single else results
 
 
-def NumLinks(corpus, page):
+def personalized_iteration(matrix, dangling, damping_factor, jumps,
+                           tolerance=1e-6, norm="max", max_iterations=1000):
     """
-    Return number of links in a given page in the corpus
+    Return the N x K matrix of personalized PageRank vectors for the
+    transition matrix `matrix`, the indices of `dangling` pages and the
+    N x K matrix `jumps` of teleport distributions, one per column, and
+    the number of iterations taken.
+
+    Each iteration is one sparse matrix-matrix product shared by all the
+    columns, updated in place to avoid temporary matrices.
     """
-    n = len(corpus[page])
-    # print(n)
-    # if no links, interpret it as having links to all the pages including itself
-    if n == 0:
-        n = len(corpus.keys())
+    N = matrix.shape[0]
+    teleport = (1 - damping_factor) * jumps
+    ranks = jumps.copy()
+    for i in range(1, max_iterations + 1):
+        new_ranks = matrix @ ranks
+        if len(dangling):
+            new_ranks += ranks[dangling].sum(axis=0) / N
+        new_ranks *= damping_factor
+        new_ranks += teleport
+
+        # measure the change of each column in the old ranks' buffer
+        np.subtract(new_ranks, ranks, out=ranks)
+        delta = np.linalg.norm(ranks, ord=NORMS[norm], axis=0).max()
+        ranks = new_ranks
+        if delta < tolerance:
+            break
+    return ranks, i
+
 
-    return n
+def teleport_vector(graph, teleport):
+    """
+    Return the teleport distribution `teleport` over the pages of `graph`
+    as a NumPy vector summing to 1. `teleport` is a dictionary from page
+    names to non-negative weights, a collection of seed pages that share
+    the probability evenly, or a single page name.
+    """
+    vector = np.zeros(len(graph))
+    if isinstance(teleport, str):
+        teleport = [teleport]
+    if isinstance(teleport, dict):
+        for page, weight in teleport.items():
+            vector[graph.index[page]] += weight
+    else:
+        for page in teleport:
+            vector[graph.index[page]] = 1
+    total = vector.sum()
+    if total <= 0:
+        raise ValueError("Teleport distribution must have a positive total weight")
+    return vector / total
+
+
+def update_pagerank(directory, damping_factor, state_file=None,
+                    tolerance=1e-6):
+    """
+    Return PageRank values for the HTML pages in `directory`, reusing the
+    ranks and parsed links saved in `state_file` (by default
+    ".pagerank.npz" in `directory`) by the previous call.
+
+    Only pages whose modification time or size changed are re-read, and
+    only those whose content hash also changed are parsed again. The
+    saved ranks are then corrected with `push_pagerank`, starting from the
+    pages whose links changed, until the total residual is below
+    `tolerance`. Without saved ranks for `damping_factor`, the ranks are
+    computed from scratch by power iteration to the same tolerance.
+
+    Return the ranks dictionary and a dict of statistics.
+    """
+    if state_file is None:
+        state_file = os.path.join(directory, ".pagerank.npz")
+    state = load_state(state_file)
+
+    # Every name ever seen as a page or a link keeps its number across
+    # updates, so the saved links of unchanged pages stay valid
+    names = state["names"].tolist()
+    ids = {name: k for k, name in enumerate(names)}
+    known = len(names)
+
+    def name_id(name):
+        if name not in ids:
+            ids[name] = len(names)
+            names.append(name)
+        return ids[name]
+
+    # Re-crawl only the files that changed since the last update
+    saved_page = state["is_page"].tolist()
+    saved_mtime = state["mtime"].tolist()
+    saved_size = state["size"].tolist()
+    saved_sha1 = state["sha1"].tolist()
+    present = []
+    stats = dict()
+    content = dict()
+    for entry in os.scandir(directory):
+        if not entry.name.endswith(".html") or not entry.is_file():
+            continue
+        k = name_id(entry.name)
+        present.append(k)
+        stat = entry.stat()
+        seen = k < known and saved_page[k]
+        if (seen and saved_mtime[k] == stat.st_mtime_ns
+                and saved_size[k] == stat.st_size):
+            continue
+        with open(entry.path, "rb") as f:
+            digest = hashlib.sha1(f.read()).digest()
+        stats[k] = (stat.st_mtime_ns, stat.st_size, digest)
+        if not seen or saved_sha1[k] != digest:
+            links = sorted(name_id(link) for link in extract_links(entry.path))
+            content[k] = np.array(links, dtype=np.int32)
+
+    # Extend the saved arrays to the names first seen in this update
+    new = len(names) - known
+    was_page = np.concatenate((state["is_page"], np.zeros(new, dtype=bool)))
+    old_ranks = np.concatenate((state["ranks"], np.zeros(new)))
+    old_residual = np.concatenate((state["residual"], np.zeros(new)))
+    mtime = np.concatenate((state["mtime"], np.zeros(new, dtype=np.int64)))
+    size = np.concatenate((state["size"], np.zeros(new, dtype=np.int64)))
+    sha1 = np.concatenate((state["sha1"], np.zeros(new, dtype="S20")))
+    old_offsets = np.concatenate((
+        state["offsets"], np.full(new, state["offsets"][-1])
+    ))
+    old_links = state["links"]
+    for k, (file_mtime, file_size, digest) in stats.items():
+        mtime[k], size[k], sha1[k] = file_mtime, file_size, digest
+
+    is_page = np.zeros(len(names), dtype=bool)
+    is_page[present] = True
+    for k in np.flatnonzero(was_page & ~is_page).tolist():
+        content[k] = np.zeros(0, dtype=np.int32)
+
+    # Patch the saved links of the changed pages
+    rows = sorted(content)
+    offsets, links = patch_rows(
+        old_offsets, old_links, rows, [content[k] for k in rows]
+    )
+
+    # Build the graph, only including links to other pages in the corpus
+    page_ids = np.flatnonzero(is_page)
+    N = len(page_ids)
+    position = np.full(len(names), -1, dtype=np.int64)
+    position[page_ids] = np.arange(N)
+    linking = np.repeat(np.arange(len(names)), np.diff(offsets))
+    sources = position[linking]
+    targets = position[links]
+    keep = (sources >= 0) & (targets >= 0) & (sources != targets)
+    pages = [names[k] for k in page_ids.tolist()]
+    graph = Graph.from_edges(pages, sources[keep], targets[keep])
+
+    if state["damping"] == damping_factor and N and state["is_page"].any():
+        # Pages whose links within the corpus changed are those whose
+        # content changed and those linking to pages added or removed.
+        # Each moves its share of rank from its old to its new targets.
+        flipped = was_page != is_page
+        changed_pages = set(rows).union(linking[flipped[links]].tolist())
+        residual = old_residual.copy()
+        for u in changed_pages:
+            for flags, row_offsets, row_links, sign in (
+                (was_page, old_offsets, old_links, -1),
+                (is_page, offsets, links, 1)
+            ):
+                if not flags[u]:
+                    continue
+                outbound = np.unique(row_links[row_offsets[u]:row_offsets[u + 1]])
+                outbound = outbound[flags[outbound] & (outbound != u)]
+                if len(outbound):
+                    share = damping_factor * old_ranks[u] / len(outbound)
+                    residual[outbound] += sign * share
+
+        # Added pages start with no rank, so are missing the rank every
+        # page receives from random jumps and pages without links
+        residual[is_page & ~was_page] += state["level"]
+
+        ranks, residual, pushes, iterations = push_pagerank(
+            graph, old_ranks[page_ids], residual[page_ids],
+            damping_factor, tolerance
+        )
+    else:
+        ranks, iterations = power_iteration(
+            graph.transition_matrix(), graph.dangling,
+            damping_factor, tolerance, "l1"
+        )
+        residual = pagerank_residual(graph, ranks, damping_factor)
+        pushes = 0
+
+    all_ranks = np.zeros(len(names))
+    all_ranks[page_ids] = ranks
+    all_residual = np.zeros(len(names))
+    all_residual[page_ids] = residual
+    dangling_rank = ranks[graph.dangling].sum()
+    save_state(state_file, {
+        "names": np.array(names, dtype=str), "is_page": is_page,
+        "mtime": mtime, "size": size, "sha1": sha1,
+        "offsets": offsets, "links": links,
+        "ranks": all_ranks, "residual": all_residual,
+        "damping": np.array(damping_factor),
+        "level": np.array((1 - damping_factor + damping_factor * dangling_rank) / max(N, 1))
+    })
+    return dict(zip(pages, ranks.tolist())), {
+        "pages": N, "changed": len(content),
+        "pushes": pushes, "iterations": iterations
+    }
+
+
+def load_state(path):
+    """
+    Return the arrays saved in `path` by `update_pagerank`, or empty ones
+    if there is no usable saved state.
+
+    For each name seen as a page or a link, the state holds whether it is
+    a page of the corpus, the modification time, size, SHA-1 digest,
+    rank and residual (see `push_pagerank`) of its file, and its links as
+    compressed rows `offsets` and `links` of name numbers. `level` is the
+    rank every page receives from random jumps and pages without links.
+    """
+    state = {
+        "names": np.zeros(0, dtype=str), "is_page": np.zeros(0, dtype=bool),
+        "mtime": np.zeros(0, dtype=np.int64), "size": np.zeros(0, dtype=np.int64),
+        "sha1": np.zeros(0, dtype="S20"), "offsets": np.zeros(1, dtype=np.int64),
+        "links": np.zeros(0, dtype=np.int32), "ranks": np.zeros(0),
+        "residual": np.zeros(0), "damping": np.array(np.nan), "level": np.array(0.0)
+    }
+    try:
+        with np.load(path) as saved:
+            if set(saved.files) == set(state):
+                return {key: saved[key] for key in saved.files}
+    except (OSError, ValueError):
+        pass
+    return state
+
+
+def save_state(path, state):
+    """
+    Save the `state` arrays of `update_pagerank` to `path`, replacing the
+    previous state only once the new one is completely written.
+    """
+    temporary = path + ".tmp"
+    with open(temporary, "wb") as f:
+        np.savez(f, **state)
+    os.replace(temporary, path)
 
 
-def links_to(corpus, page):
+def patch_rows(offsets, values, rows, new_rows):
+    """
+    Return the compressed rows `offsets` and `values` with each row
+    `rows[k]` replaced by the array `new_rows[k]`, where `rows` is in
+    increasing order. Unchanged rows are copied in blocks.
     """
-    Return list of pages in given corpus which have link to given page
+    lengths = np.diff(offsets)
+    pieces = []
+    start = 0
+    for row, new_row in zip(rows, new_rows):
+        pieces.append(values[offsets[start]:offsets[row]])
+        pieces.append(new_row)
+        lengths[row] = len(new_row)
+        start = row + 1
+    pieces.append(values[offsets[start]:])
+
+    new_offsets = np.zeros(len(offsets), dtype=np.int64)
+    np.cumsum(lengths, out=new_offsets[1:])
+    return new_offsets, np.concatenate(pieces).astype(np.int32, copy=False)
+
+
+def push_pagerank(graph, ranks, residual, damping_factor, tolerance=1e-6,
+                  max_pushes=None):
     """
-    # intiatize an empty links list
-    links = []
+    Return the PageRank vector of `graph` correcting the estimate `ranks`,
+    its remaining residual, and the numbers of push operations and power
+    iterations taken.
+
+    `residual` is the vector of residuals of the PageRank equation at
+    `ranks`, leaving out any part shared evenly by all pages; after a small
+    change to the corpus, only the pages around the change have one. Each
+    push adds a page's residual to its rank and passes `damping_factor` of
+    it on to the pages it links to, until no page has a residual above
+    `tolerance` times its rank, so the total is below `tolerance`. Rank
+    passed on by pages without links would reach every page evenly, which
+    normalizing the ranks at the end accounts for.
+
+    When the change spreads too far for that to pay off, after
+    `max_pushes` pushes (by default a tenth of the number of pages), the
+    ranks are finished by power iteration instead.
+    """
+    if max_pushes is None:
+        max_pushes = len(graph) // 10 + 100
+
+    x = ranks.copy()
+    r = dict(zip(np.flatnonzero(residual).tolist(), residual[residual != 0].tolist()))
+    queue = deque(u for u, value in r.items() if abs(value) > tolerance * x[u])
+    queued = set(queue)
+    pushes = 0
+    while queue and pushes < max_pushes:
+        u = queue.popleft()
+        queued.discard(u)
+        rho = r.pop(u)
+        x[u] += rho
+        pushes += 1
+
+        links = graph.outbound(u)
+        if not len(links):
+            continue
+        share = damping_factor * rho / len(links)
+        for v in links.tolist():
+            value = r.get(v, 0) + share
+            r[v] = value
+            if v not in queued and abs(value) > tolerance * x[v]:
+                queued.add(v)
+                queue.append(v)
+
+    total = x.sum()
+    if queue:
+        x, iterations = power_iteration(
+            graph.transition_matrix(), graph.dangling, damping_factor,
+            tolerance, "l1", ranks=x / total
+        )
+        return x, pagerank_residual(graph, x, damping_factor), pushes, iterations
+
+    residual = np.zeros(len(graph))
+    residual[list(r)] = list(r.values())
+    return x / total, residual / total, pushes, 0
 
-    # iterate over the corpus pages and thier links
-    for p, l in corpus.items():
-        # if page in the current links, append it to the list
-        # if not and llinks
-        #  is empty, interpret it as having links to
-        # all the pages and append it to the list
-        if page in l:
-            links.append(p)
-        elif not l:  # if empty
-            links.append(p)
 
-    return links
+def pagerank_residual(graph, ranks, damping_factor):
+    """
+    Return the vector of residuals of the PageRank equation of `graph`
+    at `ranks`, one step of the equation applied to `ranks` minus `ranks`.
+    """
+    step = pagerank_step(
+        graph.transition_matrix(), graph.dangling, damping_factor, ranks
+    )
+    return step - ranks
 
 
 if __name__ == "__main__":